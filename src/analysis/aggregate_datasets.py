@@ -4,10 +4,21 @@ import numpy as np
 import os
 import argparse
 import ast
+import hashlib
+import inspect
+import io
+import shutil
 import string
 import re
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone, timedelta
+from utils import aggregate_week_since_repo_creation, contributor_activity, read_index
+
+# columns with identifiers that share a dictionary of categories
+IDENTIFIER_COLUMNS = [["github_user_cleaned_url"], ["user", "author", "closed_by"]]
+IDENTIFIER_DTYPES = {column: str for columns in IDENTIFIER_COLUMNS for column in columns}  # all-digit names are not numbers
 
 def info(verbose, msg):
     """Print message to stdout if verbose is True.
@@ -38,28 +49,16 @@ def license_type(contents):
         contents.license == "other", "unknown", "non-permissive")))
     return contents
 
-def team_size(contributions):
+def team_size(activity_df):
     """Count the number of (active) contributors for each repository over time. A user is an active contributor if they made at least one commit in last 12 weeks.
 
     Args:
-        contributions (pd.DataFrame): dataframe with GitHub commit data
+        activity_df (pd.DataFrame): dataframe from contributor_activity
 
     Returns:
         pd.DataFrame: data frame where each row corresponds to one week in a repo's life and includes the number of active contributors and overall contributors
     """
-    team_df = contributions[["github_user_cleaned_url", "author", "week_since_repo_creation_week_co", "commits"]].set_index(["github_user_cleaned_url", "author", "week_since_repo_creation_week_co"]).sort_index()
-    # user is active contributor if made at least one commit in last 12 weeks
-    windowed_team_df = team_df.groupby(level=["github_user_cleaned_url", "author"]).rolling(window=12, min_periods=0).sum().droplevel([0, 1])
-    final_index = windowed_team_df.index.droplevel(1).unique()
-    windowed_team_df["active_contributors"] = windowed_team_df.commits > 0
-    # contributor team size
-    contrib_team_size = windowed_team_df.groupby(level=["github_user_cleaned_url", "week_since_repo_creation_week_co"])["active_contributors"].value_counts()[:,:,True].reindex(final_index, fill_value=0).astype(int)
-    # overall pool of contributors
-    contributor_pool_df = team_df.groupby(["github_user_cleaned_url", "author"]).cumsum()
-    contributor_pool_df["contributors"] = contributor_pool_df.commits > 0
-    contrib_pool = contributor_pool_df.groupby(level=["github_user_cleaned_url", "week_since_repo_creation_week_co"])["contributors"].value_counts()[:,:,True].reindex(final_index, fill_value=0).astype(int)
-    contributors_df = pd.merge(contrib_team_size, contrib_pool, left_index=True, right_index=True)
-    contributors_df.index.rename({"week_since_repo_creation_week_co": "week_since_repo_creation"}, inplace=True)
+    contributors_df = activity_df[["active_contributors", "contributors"]].groupby(level=["github_user_cleaned_url", "week_since_repo_creation"], observed=True).sum().astype(int)
     return contributors_df
 
 def readme_size_classification(contents):
@@ -85,18 +84,61 @@ def readme_size_classification(contents):
     contents["readme_size_class"] = contents.readme_size.map(map_size)
     return contents
 
-def load_data(data_dir, filename, to_datetime=None):
+def read_rows(path, repos):
+    """Read the rows of some repositories from a data file. Uses the index next to the file (written by the scripts in src/github) to skip the rows of all other repositories if there is one and the file has not changed since it was indexed, otherwise reads the file in chunks.
+
+    Args:
+        path (str): path to CSV or Parquet (".parquet") file
+        repos (list<str>): repository IDs
+
+    Returns:
+        pd.DataFrame: rows of the repositories, in the order of the file
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        index = read_index(path)
+        if index is None:
+            return pq.read_table(path, filters=[("github_user_cleaned_url", "in", list(repos))]).to_pandas()
+        f = pq.ParquetFile(path)
+        ranges = index[index["github_user_cleaned_url"].isin(repos)].sort_values("start")
+        rows = np.concatenate([np.empty(0, dtype=int)] + [np.arange(start, end) for start, end in zip(ranges.start, ranges.end)])
+        group_sizes = np.array([f.metadata.row_group(i).num_rows for i in range(f.num_row_groups)], dtype=int)
+        group_starts = np.cumsum(group_sizes) - group_sizes
+        groups = np.unique(np.searchsorted(group_starts, rows, side="right") - 1)
+        table = f.read_row_groups(groups.tolist()) if len(groups) > 0 else f.schema_arrow.empty_table()
+        # row positions within the row groups that were read
+        group_offsets = np.zeros(f.num_row_groups, dtype=int)
+        group_offsets[groups] = np.cumsum(group_sizes[groups]) - group_sizes[groups] - group_starts[groups]
+        return table.take(rows + group_offsets[np.searchsorted(group_starts, rows, side="right") - 1]).to_pandas()
+    index = read_index(path)
+    if index is None:
+        return pd.concat([chunk[chunk["github_user_cleaned_url"].isin(repos)] for chunk in pd.read_csv(path, index_col=0, dtype=IDENTIFIER_DTYPES, chunksize=100000)])
+    ranges = index[index["github_user_cleaned_url"].isin(repos)].sort_values("start")
+    with open(path, "rb") as f:
+        data = [f.readline()]  # header
+        for start, end in zip(ranges.start, ranges.end):
+            f.seek(start)
+            data.append(f.read(end - start))
+    return pd.read_csv(io.BytesIO(b"".join(data)), index_col=0, dtype=IDENTIFIER_DTYPES)
+
+def load_data(data_dir, filename, to_datetime=None, repos=None):
     """Load dataframes from file and convert relevant dolumns to datetime type.
 
     Args:
         data_dir (str): path to data folder
-        filename (str): name of data file
+        filename (str): name of data file, CSV or Parquet (".parquet")
         to_datetime (list<str> | str, optional): Columns that should be converted to datetime. Defaults to None.
+        repos (list<str>, optional): only load the data of these repositories. Defaults to None.
 
     Returns:
         pd.DataFrame: modified data frame
     """
-    df = pd.read_csv(os.path.join(data_dir, filename), index_col=0)
+    if repos is not None:
+        df = read_rows(os.path.join(data_dir, filename), repos)
+    elif filename.endswith(".parquet"):  # datetime columns are already typed, lists are stored natively
+        df = pd.read_parquet(os.path.join(data_dir, filename))
+    else:
+        df = pd.read_csv(os.path.join(data_dir, filename), index_col=0, dtype=IDENTIFIER_DTYPES)
     if type(to_datetime) == list:
         for dt in to_datetime:
             df[dt] = pd.to_datetime(df[dt], utc=True)
@@ -104,26 +146,6 @@ def load_data(data_dir, filename, to_datetime=None):
         df[to_datetime] = pd.to_datetime(df[to_datetime], utc=True)
     return df
 
-def aggregate_week_since_repo_creation(metadata, df, label=None):
-    """Translate date columns into weeks since repo creation.
-
-    Args:
-        metadata (pd.DataFrame): dataframe with columns "github_user_cleaned_url" and "created_at"
-        df (pd.DataFrame): dataframe that should be aggregated
-        label (list<str> | str, optional): column name(s) with date information
-
-    Returns:
-        pd.DataFrame: input dataframe with added column "week_since_repo_creation_{original_column_name}"
-    """
-    repo_creation_df = metadata[["created_at", "github_user_cleaned_url"]].rename(columns={"created_at": "repo_created_at"})
-    df = pd.merge(df, repo_creation_df, on="github_user_cleaned_url")
-    if type(label) == list:
-        for column in label:
-            df[f"week_since_repo_creation_{column}"] = (df[column] - df.repo_created_at).dt.days // 7
-    elif type(label) == str:
-        df[f"week_since_repo_creation_{label}"] = (df[label] - df.repo_created_at).dt.days // 7
-    return df
-
 def filter_repo(df, repo):
     """Choose subset of dataframe that deals with a specific GitHub repository.
 
@@ -136,6 +158,19 @@ def filter_repo(df, repo):
     """
     return df[df["github_user_cleaned_url"] == repo]
 
+def as_list(value):
+    """Read a list from a README history column, stored natively in Parquet files and as its Python representation in CSV files.
+
+    Args:
+        value (str | np.ndarray): column value
+
+    Returns:
+        list: the list
+    """
+    if type(value) == str:
+        return ast.literal_eval(value)
+    return list(value)
+
 def clean_headings(readme_df):
     """Remove digits (e.g. heading or version numbering) from headings, convert to lowercase.
 
@@ -146,7 +181,7 @@ def clean_headings(readme_df):
         pd.DataFrame: input dataframe with additional columns "cleaned_added_headings" and "cleaned_deleted_headings"
     """
     def clean(headings_list):
-        l = ast.literal_eval(headings_list)
+        l = as_list(headings_list)
         to_remove = string.digits + string.whitespace + ".:"
         cleaned_headings_list = []
         for h in l:
@@ -173,9 +208,9 @@ def engagement_counts(stars, forks):
     Returns:
         pd.DataFrame: dataframe with columns "github_user_cleaned_url", "stars_count", "forks_count"
     """
-    fork_counts = forks.groupby("github_user_cleaned_url")["user"].count()
+    fork_counts = forks.groupby("github_user_cleaned_url", observed=True)["user"].count()
     fork_counts.rename("forks_count", inplace=True)
-    star_counts = stars.groupby("github_user_cleaned_url")["user"].count()
+    star_counts = stars.groupby("github_user_cleaned_url", observed=True)["user"].count()
     star_counts.rename("stars_count", inplace=True)
     engagement_df = pd.concat([fork_counts, star_counts], axis=1).reset_index()
     return engagement_df    
@@ -196,6 +231,7 @@ def analyse_headings(df):
         "usage": ["requirements", "using", "example", "usage", "run", "install", "installing", "installation", "tutorial", "tutorials", "build", "guide", "documentation"]
     }
     df = df.fillna(value={"added_headings": ""})
+    df["added_headings"] = df.added_headings.map(lambda l: l if type(l) == str else str(as_list(l)))  # match against the list representation
     df["ownership_addition"] = df.added_headings.str.contains("|".join(interesting_words["ownership"]), case=False)
     df["usage_addition"] = df.added_headings.str.contains("|".join(interesting_words["usage"]), case=False)
     df = df.astype({
@@ -204,135 +240,201 @@ def analyse_headings(df):
     })
     return df
 
-def user_type_wrt_issues(issues, timelines_df):
-    """Determine issue user status (opening, closing, both, inactive).
+def issue_user_sequences(issues, timelines_df):
+    """Count created and closed issues by user and week, and lay out the weeks of life of each repo for each user who created or closed issues in it, one after the other, ordered by user.
 
     Args:
         issues (pd.DataFrame): dataframe with issue data
-        timelines_df (pd.DataFrame): dataframe from timeline_init
+        timelines_df (pd.DataFrame): dataframe from timelines_init
 
     Returns:
-        pd.DataFrame: dataframe with columns "created_count", "closed_count", "user_status" for each user of each repo in each week of life of the repo
+        tuple<pd.DataFrame>: counts with columns "github_user_cleaned_url", "user", "week_since_repo_creation", "created_count", "closed_count", "position" (row in the sequences), "end", and sequences with columns "github_user_cleaned_url", "user", "min_week", "length", "start", "end" (rows where the weeks of the repo for the user start and end)
     """
     # count number of created and closed issues by user + week
-    created = issues.groupby(["github_user_cleaned_url", "user", "week_since_repo_creation_created_at"])["state"].count().rename("created_count")
+    created = issues.groupby(["github_user_cleaned_url", "user", "week_since_repo_creation_created_at"], observed=True)["state"].count().rename("created_count")
     created.index.rename({"week_since_repo_creation_created_at": "week_since_repo_creation"}, inplace=True)
-    closed = issues.groupby(["github_user_cleaned_url", "closed_by", "week_since_repo_creation_closed_at"])["state"].count().rename("closed_count")
+    closed = issues.groupby(["github_user_cleaned_url", "closed_by", "week_since_repo_creation_closed_at"], observed=True)["state"].count().rename("closed_count")
     closed.index.rename({"week_since_repo_creation_closed_at": "week_since_repo_creation", "closed_by": "user"}, inplace=True)
-    issues_by_user = pd.merge(created, closed, left_index=True, right_index=True, how="outer").reset_index()
+    issues_by_user = pd.merge(created, closed, left_index=True, right_index=True, how="outer").reset_index().fillna(0)
     issues_by_user["week_since_repo_creation"] = issues_by_user["week_since_repo_creation"].astype(int)
-    issue_users_per_repo = issues_by_user.groupby("github_user_cleaned_url")["user"].unique()
-    # build timeline DataFrame
-    df = pd.merge(timelines_df, issue_users_per_repo, left_index=True, right_index=True, how="left").explode("user")
-    df = df.reset_index().set_index(["github_user_cleaned_url", "week_since_repo_creation", "user"])
-    issues_by_user = issues_by_user.set_index(["github_user_cleaned_url", "week_since_repo_creation", "user"])
-    df = pd.merge(df, issues_by_user, left_index=True, right_index=True, how="left")
-    df.fillna(0, inplace=True)
-    # determine user status with window of 12 weeks onwards
-    windowed_issue_user_df = df.groupby(level="user").rolling(window=12, min_periods=0).sum().droplevel(0)
-    conditions = [(windowed_issue_user_df.created_count > 0) & (windowed_issue_user_df.closed_count == 0),
-                  (windowed_issue_user_df.created_count == 0) & (windowed_issue_user_df.closed_count > 0),
-                  (windowed_issue_user_df.created_count > 0) & (windowed_issue_user_df.closed_count > 0)]
+    # one sequence per repo and user, ordered by user
+    sequences = issues_by_user[["github_user_cleaned_url", "user"]].drop_duplicates()
+    sequences["repo"] = timelines_df.index.get_indexer(sequences.github_user_cleaned_url)
+    sequences = sequences.sort_values(["user", "repo"]).reset_index(drop=True)
+    spans = timelines_df.iloc[sequences.repo]
+    sequences["min_week"] = spans.min_week.to_numpy()
+    sequences["length"] = (spans.max_week - spans.min_week + 1).to_numpy()
+    sequences["start"] = sequences.length.cumsum() - sequences.length
+    sequences["end"] = sequences.start + sequences.length
+    pair = pd.MultiIndex.from_frame(sequences[["github_user_cleaned_url", "user"]]).get_indexer(pd.MultiIndex.from_frame(issues_by_user[["github_user_cleaned_url", "user"]]))
+    issues_by_user["position"] = sequences.start.to_numpy()[pair] + issues_by_user.week_since_repo_creation.to_numpy() - sequences.min_week.to_numpy()[pair]
+    issues_by_user["end"] = sequences.end.to_numpy()[pair]
+    return issues_by_user, sequences.drop(columns="repo")
+
+def user_status(created_count, closed_count):
+    """Determine issue user status from the number of created and closed issues in a window.
+
+    Args:
+        created_count (np.ndarray): number of issues created by the user
+        closed_count (np.ndarray): number of issues closed by the user
+
+    Returns:
+        np.ndarray: user status, "opening", "closing", "both" or "inactive"
+    """
+    conditions = [(created_count > 0) & (closed_count == 0),
+                  (created_count == 0) & (closed_count > 0),
+                  (created_count > 0) & (closed_count > 0)]
     choices = ["opening", "closing", "both"]
-    windowed_issue_user_df["user_status"] = np.select(conditions, choices, default="inactive")
+    return np.select(conditions, choices, default="inactive")
+
+def user_type_wrt_issues(issues, timelines_df):
+    """Determine issue user status (opening, closing, both) with a window of 12 weeks onwards, as spans of weeks with the same status. Users are inactive in all other weeks of the repos they created or closed issues in.
+
+    Args:
+        issues (pd.DataFrame): dataframe with issue data
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+
+    Returns:
+        pd.DataFrame: dataframe with columns "start_week", "end_week" (inclusive), "user_status" for each span of each user of each repo
+    """
+    issues_by_user, sequences = issue_user_sequences(issues, timelines_df)
+    created = issues_by_user[issues_by_user.created_count > 0]
+    closed = issues_by_user[issues_by_user.closed_count > 0]
+    # each event opens a window of 12 weeks; count open windows between all window and repo boundaries
+    total = sequences.length.sum()
+    points = np.concatenate([
+        created.position, np.minimum(created.position + 12, created.end),
+        closed.position, np.minimum(closed.position + 12, closed.end),
+        sequences.start, [total]
+    ])
+    created_delta = np.concatenate([np.ones(len(created)), -np.ones(len(created)), np.zeros(2 * len(closed) + len(sequences) + 1)])
+    closed_delta = np.concatenate([np.zeros(2 * len(created)), np.ones(len(closed)), -np.ones(len(closed)), np.zeros(len(sequences) + 1)])
+    points, point = np.unique(points, return_inverse=True)
+    created_windows = np.cumsum(np.bincount(point, weights=created_delta))[:-1]
+    closed_windows = np.cumsum(np.bincount(point, weights=closed_delta))[:-1]
+    # merge segments with the same status within a repo
+    starts = points[:-1]
+    status = user_status(created_windows, closed_windows)
+    pair = np.searchsorted(sequences.start, starts, side="right") - 1
+    new_span = np.ones(len(starts), dtype=bool)
+    new_span[1:] = (status[1:] != status[:-1]) | (pair[1:] != pair[:-1])
+    starts, status, pair = starts[new_span], status[new_span], pair[new_span]
+    ends = np.append(starts[1:], total)
+    active = status != "inactive"
+    starts, ends, status, pair = starts[active], ends[active], status[active], pair[active]
+    offsets = sequences.min_week.to_numpy()[pair] - sequences.start.to_numpy()[pair]
+    spans_df = pd.DataFrame({
+        "github_user_cleaned_url": sequences.github_user_cleaned_url.array.take(pair),
+        "user": sequences.user.array.take(pair),
+        "start_week": starts + offsets,
+        "end_week": ends - 1 + offsets,
+        "user_status": status
+    }).set_index(["github_user_cleaned_url", "user"])
+    return spans_df
+
+def expand_user_type_wrt_issues(issues, timelines_df):
+    """Determine issue user status (opening, closing, both, inactive) for every week, with a window of 12 weeks onwards.
+
+    Args:
+        issues (pd.DataFrame): dataframe with issue data
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+
+    Returns:
+        pd.DataFrame: dataframe with columns "created_count", "closed_count", "user_status" for each user of each repo in each week of life of the repo
+    """
+    issues_by_user, sequences = issue_user_sequences(issues, timelines_df)
+    lengths = sequences.length.to_numpy()
+    total = lengths.sum()
+    week = np.arange(total) - np.repeat(sequences.start.to_numpy() - sequences.min_week.to_numpy(), lengths)
+    index = pd.MultiIndex.from_arrays([
+        pd.Index(sequences.github_user_cleaned_url).repeat(lengths),
+        week,
+        pd.Index(sequences.user).repeat(lengths)
+    ], names=["github_user_cleaned_url", "week_since_repo_creation", "user"])
+    windowed_issue_user_df = pd.DataFrame(index=index)
+    window_start = np.maximum(np.arange(total) - 11, np.repeat(sequences.start.to_numpy(), lengths))
+    for column in ["created_count", "closed_count"]:
+        totals = np.concatenate([[0], np.cumsum(np.bincount(issues_by_user.position, weights=issues_by_user[column], minlength=total))])
+        windowed_issue_user_df[column] = totals[1:] - totals[window_start]
+    windowed_issue_user_df["user_status"] = user_status(windowed_issue_user_df.created_count, windowed_issue_user_df.closed_count)
     return windowed_issue_user_df
 
-def user_type_wrt_commits(contributions):
+def user_type_wrt_commits(activity_df):
     """Determine commit author status (active, inactive) and number of commits over time.
 
     Args:
-        contributions (pd.DataFrame): dataframe with GitHub commit data
+        activity_df (pd.DataFrame): dataframe from contributor_activity
 
     Returns:
         pd.DataFrame: dataframe with columns 'commits', 'active_contributors' for each repo, week and user
     """
-    team_df = contributions[["github_user_cleaned_url", "author", "week_since_repo_creation_week_co", "commits"]].set_index(["github_user_cleaned_url", "author", "week_since_repo_creation_week_co"]).sort_index()
-    # user is active contributor if made at least one commit in last 12 weeks
-    windowed_team_df = team_df.groupby(level=["github_user_cleaned_url", "author"]).rolling(window=12, min_periods=0).sum().droplevel([0, 1])
-    windowed_team_df["active_contributors"] = windowed_team_df.commits > 0
-    windowed_team_df.index.rename({"week_since_repo_creation_week_co": "week_since_repo_creation"}, inplace=True)
-    return windowed_team_df
+    return activity_df[["commits", "active_contributors"]]
 
-def no_open_and_closed_issues(issues, timelines_df):
+def no_open_and_closed_issues(issues, timelines_df, index=None):
     """Build a timeline of weekly open and closed issue counts.
 
     Args:
         issues (pd.DataFrame): dataframe with issue data
-        timelines_df (pd.DataFrame): dataframe from timeline_init
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+        index (pd.MultiIndex, optional): timeline_index(timelines_df), if already built. Defaults to None.
 
     Returns:
         pd.DataFrame: dataframe with columns closed_count, open_count for each repo and week
     """
-    timelines_df.reset_index(inplace=True)
-    # merge weeks for issue opening events
-    opened_issues_weekly_df = pd.merge(timelines_df, issues[["github_user_cleaned_url", "week_since_repo_creation_created_at"]], how="left", left_on=["github_user_cleaned_url", "week_since_repo_creation"], right_on=["github_user_cleaned_url", "week_since_repo_creation_created_at"])
-    opened_issues_weekly_df["week_since_repo_creation"].fillna(opened_issues_weekly_df["week_since_repo_creation_created_at"], inplace=True)  # NaN will happen for issues created in negative weeks
-    # merge weeks for issue closing events
-    closed_issues_weekly_df = pd.merge(timelines_df, issues[["github_user_cleaned_url", "week_since_repo_creation_closed_at"]], how="left", left_on=["github_user_cleaned_url", "week_since_repo_creation"], right_on=["github_user_cleaned_url", "week_since_repo_creation_closed_at"])
-    closed_issues_weekly_df["week_since_repo_creation"].fillna(closed_issues_weekly_df["week_since_repo_creation_closed_at"], inplace=True)  # NaN will happen for issues created in negative weeks
-    # cumulative counts
-    count_open = opened_issues_weekly_df.groupby(["github_user_cleaned_url", "week_since_repo_creation"])["week_since_repo_creation_created_at"].count().groupby(level=0).cumsum()
-    count_closed = closed_issues_weekly_df.groupby(["github_user_cleaned_url", "week_since_repo_creation"])["week_since_repo_creation_closed_at"].count().groupby(level=0).cumsum().rename("closed_count")
-    issue_counts_df = pd.DataFrame(count_closed)
-    issue_counts_df["open_count"] = count_open - issue_counts_df["closed_count"]
-    issue_counts_df = issue_counts_df.astype({
-        "closed_count": int,
-        "open_count": int
-    })
+    count_open = weekly_counts(timelines_df, issues.github_user_cleaned_url, issues.week_since_repo_creation_created_at, cumulative=True)
+    count_closed = weekly_counts(timelines_df, issues.github_user_cleaned_url, issues.week_since_repo_creation_closed_at, cumulative=True)
+    issue_counts_df = pd.DataFrame({
+        "closed_count": count_closed,
+        "open_count": count_open - count_closed
+    }, index=timeline_index(timelines_df) if index is None else index)
     return issue_counts_df
        
-def engagement(forks, stars, timelines_df):
+def engagement(forks, stars, timelines_df, index=None):
     """Build a timeline of weekly forks and stars counts.
 
     Args:
         forks (pd.DataFrame): dataframe with fork events data
         stars (pd.DataFrame): dataframe with star events data
-        timelines_df (pd.DataFrame): dataframe from timeline_init
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+        index (pd.MultiIndex, optional): timeline_index(timelines_df), if already built. Defaults to None.
 
     Returns:
         pd.DataFrame: dataframe with columns forks_count, stars_count for each repo and week
     """
-    forks_df = forks[["github_user_cleaned_url", "week_since_repo_creation_date", "user"]].groupby(["github_user_cleaned_url", "week_since_repo_creation_date"]).count().rename(columns={"user": "forks_count"}).sort_index()
-    stars_df = stars[["github_user_cleaned_url", "week_since_repo_creation_date", "user"]].groupby(["github_user_cleaned_url", "week_since_repo_creation_date"]).count().rename(columns={"user": "stars_count"}).sort_index()
-    engagement_df = pd.merge(timelines_df, forks_df, left_on=["github_user_cleaned_url", "week_since_repo_creation"], right_index=True, how="outer")
-    engagement_df = pd.merge(engagement_df, stars_df, left_on=["github_user_cleaned_url", "week_since_repo_creation"], right_index=True, how="outer").fillna(0)
-    engagement_df = engagement_df.set_index(["github_user_cleaned_url", "week_since_repo_creation"])
-    engagement_df = engagement_df.groupby(level=0).cumsum()
-    engagement_df = engagement_df.astype({
-        "forks_count": int,
-        "stars_count": int
-    })
+    engagement_df = pd.DataFrame({
+        "forks_count": weekly_counts(timelines_df, forks.github_user_cleaned_url, forks.week_since_repo_creation_date, cumulative=True),
+        "stars_count": weekly_counts(timelines_df, stars.github_user_cleaned_url, stars.week_since_repo_creation_date, cumulative=True)
+    }, index=timeline_index(timelines_df) if index is None else index)
     return engagement_df
 
-def date_highlights(readme_history, contents, paper_data, timelines_df):
-    """_summary_
+def date_highlights(readme_history, contents, paper_data, timelines_df, index=None):
+    """Mark the weeks in which highlight events happened.
 
     Args:
         readme_history (pd.DataFrame): dataframe with columns 'github_user_cleaned_url', 'week_since_repo_creation_author_date', 'ownership_addition', 'usage_addition', 'added_cites'
         contents (pd.DataFrane): dataframe with columns 'github_user_cleaned_url', 'week_since_repo_creation_citation_added', 'week_since_repo_creation_contributing_added'
         paper_data (pd.DataFrame): dataframe with columns 'github_user_cleaned_url', 'week_since_repo_creation_date'
-        timelines_df (pd.DataFrame): dataframe from timeline_init
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+        index (pd.MultiIndex, optional): timeline_index(timelines_df), if already built. Defaults to None.
 
     Returns:
-        pd.DataFrame: dataframe with columns paper_published, contributing_file_added, citation_file_added, citation_added, usage_added, ownership_added for each repo and week
+        pd.DataFrame: dataframe with columns ownership_added, usage_added, citation_added, citation_file_added, contributing_file_added, paper_published for each repo and week
     """
-    timelines_df.set_index(["github_user_cleaned_url", "week_since_repo_creation"], inplace=True)
     event_weeks_data = {}
-    event_weeks_data["ownership_added"] = readme_history[readme_history.ownership_addition].loc[:, ["week_since_repo_creation_author_date", "github_user_cleaned_url"]].rename(columns={"week_since_repo_creation_author_date": "week_since_repo_creation"})
-    event_weeks_data["usage_added"] = readme_history[readme_history.usage_addition].loc[:, ["week_since_repo_creation_author_date", "github_user_cleaned_url"]].rename(columns={"week_since_repo_creation_author_date": "week_since_repo_creation"})
-    event_weeks_data["citation_added"] = readme_history[(readme_history.added_cites != "[]") & (readme_history.added_cites.notna())].loc[:, ["week_since_repo_creation_author_date", "github_user_cleaned_url"]].rename(columns={"week_since_repo_creation_author_date": "week_since_repo_creation"})
-    event_weeks_data["citation_file_added"] = contents[contents.week_since_repo_creation_citation_added.notna()].loc[:, ["week_since_repo_creation_citation_added", "github_user_cleaned_url"]].rename(columns={"week_since_repo_creation_citation_added": "week_since_repo_creation"})
-    event_weeks_data["contributing_file_added"] = contents[contents.week_since_repo_creation_contributing_added.notna()].loc[:, ["week_since_repo_creation_contributing_added", "github_user_cleaned_url"]].rename(columns={"week_since_repo_creation_contributing_added": "week_since_repo_creation"})
-    event_weeks_data["paper_published"] = paper_data[paper_data.week_since_repo_creation_date.notna()].loc[:, ["week_since_repo_creation_date", "github_user_cleaned_url"]].rename(columns={"week_since_repo_creation_date": "week_since_repo_creation"})
-    for k, v in event_weeks_data.items():
-        v[k] = True
-        v.set_index(["github_user_cleaned_url", "week_since_repo_creation"], inplace=True)
-        timelines_df = pd.merge(timelines_df, v, how="left", left_index=True, right_index=True)
-        timelines_df = timelines_df.fillna(value={k: False})
-    return timelines_df
+    event_weeks_data["ownership_added"] = readme_history[readme_history.ownership_addition].loc[:, ["github_user_cleaned_url", "week_since_repo_creation_author_date"]]
+    event_weeks_data["usage_added"] = readme_history[readme_history.usage_addition].loc[:, ["github_user_cleaned_url", "week_since_repo_creation_author_date"]]
+    event_weeks_data["citation_added"] = readme_history[readme_history.added_cites.map(lambda l: len(as_list(l)) > 0, na_action="ignore") == True].loc[:, ["github_user_cleaned_url", "week_since_repo_creation_author_date"]]
+    event_weeks_data["citation_file_added"] = contents.loc[:, ["github_user_cleaned_url", "week_since_repo_creation_citation_added"]]
+    event_weeks_data["contributing_file_added"] = contents.loc[:, ["github_user_cleaned_url", "week_since_repo_creation_contributing_added"]]
+    event_weeks_data["paper_published"] = paper_data.loc[:, ["github_user_cleaned_url", "week_since_repo_creation_date"]]
+    highlights_df = pd.DataFrame(
+        {k: weekly_counts(timelines_df, v.iloc[:, 0], v.iloc[:, 1]) > 0 for k, v in event_weeks_data.items()},
+        index=timeline_index(timelines_df) if index is None else index
+    )
+    return highlights_df
 
 def timelines_init(metadata, contents, contributions, forks, stars, issues, readme_history):
-    """Prepare timelines dataframe with one row for each "week of life" of each GitHub repository.
+    """Prepare timelines dataframe with the first and last "week of life" of each GitHub repository. The weeks in between are only expanded by timeline_index.
 
     Args:
         metadata (pd.DataFrame): respective dataframe with aggregated columns "week_since_repo_creation_{original_column_name}"
@@ -344,15 +446,15 @@ def timelines_init(metadata, contents, contributions, forks, stars, issues, read
         readme_history (pd.DataFrame): respective dataframe with aggregated columns "week_since_repo_creation_{original_column_name}"
 
     Returns:
-        pd.DataFrame: dataframe with columns "github_user_cleaned_url" and "week_since_repo_creation"
+        pd.DataFrame: dataframe with columns "min_week" and "max_week", indexed by "github_user_cleaned_url"
     """
     def merge_min_max_weeks(min_max_week_df, df, week_col, name):
         if type(week_col) == str:
-            max_series = df.groupby("github_user_cleaned_url")[week_col].max().rename(f"max_{name}")
-            min_series = df.groupby("github_user_cleaned_url")[week_col].min().rename(f"min_{name}")
+            max_series = df.groupby("github_user_cleaned_url", observed=True)[week_col].max().rename(f"max_{name}")
+            min_series = df.groupby("github_user_cleaned_url", observed=True)[week_col].min().rename(f"min_{name}")
         elif type(week_col) == list:
-            max_series = df.groupby("github_user_cleaned_url")[week_col].max().fillna(0).max(axis=1).rename(f"max_{name}")
-            min_series = df.groupby("github_user_cleaned_url")[week_col].min().fillna(0).min(axis=1).rename(f"min_{name}")
+            max_series = df.groupby("github_user_cleaned_url", observed=True)[week_col].max().fillna(0).max(axis=1).rename(f"max_{name}")
+            min_series = df.groupby("github_user_cleaned_url", observed=True)[week_col].min().fillna(0).min(axis=1).rename(f"min_{name}")
         min_max_week_df = pd.merge(min_max_week_df, max_series, how="left", left_on="github_user_cleaned_url", right_index=True)
         min_max_week_df = pd.merge(min_max_week_df, min_series, how="left", left_on="github_user_cleaned_url", right_index=True)
         return min_max_week_df
@@ -368,91 +470,354 @@ def timelines_init(metadata, contents, contributions, forks, stars, issues, read
     # determine overall min and max week
     max_week_df = min_max_week_df.set_index("github_user_cleaned_url").max(axis=1).rename("max_week").astype(int)
     min_week_df = min_max_week_df.set_index("github_user_cleaned_url").min(axis=1).rename("min_week").astype(int)
-    min_max_week_df = pd.merge(max_week_df, min_week_df, left_index=True, right_index=True).reset_index()
-    # add entry for each repo life week
-    #min_max_week_df["week_since_repo_creation"] = min_max_week_df["max_week"].map(lambda end: np.arange(end+1))
-    min_max_week_df["week_since_repo_creation"] = min_max_week_df.apply(lambda row: np.arange(row["min_week"], row["max_week"]+1), axis=1)
-    min_max_week_df.drop(["min_week", "max_week"], axis=1, inplace=True)
-    timelines_df = min_max_week_df.explode("week_since_repo_creation")
-    timelines_df = timelines_df.set_index("github_user_cleaned_url")
+    timelines_df = pd.merge(min_week_df, max_week_df, left_index=True, right_index=True)
     return timelines_df
 
-def main(githubdir, eprintsdir, outdir, verbose):
-    info(verbose, f"Loading data...")
-    metadata = load_data(githubdir, "metadata.csv", "created_at")
-    contents = load_data(githubdir, "contents.csv", ["citation_added", "contributing_added"])
-    contributions = load_data(githubdir, "contributions.csv", "week_co")
-    forks = load_data(githubdir, "forks.csv", "date")
-    stars = load_data(githubdir, "stars.csv", "date")
-    issues = load_data(githubdir, "issues.csv", ["created_at", "closed_at"])
-    readme_history = load_data(githubdir, "readme_history.csv", "author_date")
-    paper_data = load_data(os.path.join(eprintsdir, "cleaned_repo_urls"), "joined.csv", "date")
-    info(verbose, "Data loading complete.")
+def timeline_offsets(timelines_df):
+    """Locate the weeks of each repository in the expanded timelines.
+
+    Args:
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+
+    Returns:
+        tuple<np.ndarray>: position of the first week and number of weeks of each repository
+    """
+    lengths = (timelines_df.max_week - timelines_df.min_week + 1).to_numpy()
+    return np.cumsum(lengths) - lengths, lengths
+
+def timeline_index(timelines_df):
+    """Expand timelines into one entry for each "week of life" of each GitHub repository, in the order of the repositories in timelines_df.
+
+    Args:
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+
+    Returns:
+        pd.MultiIndex: index with levels "github_user_cleaned_url" and "week_since_repo_creation"
+    """
+    offsets, lengths = timeline_offsets(timelines_df)
+    repos = timelines_df.index.repeat(lengths)
+    weeks = np.arange(lengths.sum()) - np.repeat(offsets - timelines_df.min_week.to_numpy(), lengths)
+    return pd.MultiIndex.from_arrays([repos, weeks], names=["github_user_cleaned_url", "week_since_repo_creation"])
+
+def weekly_counts(timelines_df, repos, weeks, cumulative=False):
+    """Count events for each entry of the expanded timelines. Events outside of the timelines are ignored.
+
+    Args:
+        timelines_df (pd.DataFrame): dataframe from timelines_init
+        repos (pd.Series): repository of each event
+        weeks (pd.Series): week since repo creation of each event, NaN if the event did not happen
+        cumulative (bool, optional): count all events up to each week of a repository instead. Defaults to False.
+
+    Returns:
+        np.ndarray: number of events, aligned with timeline_index(timelines_df)
+    """
+    offsets, lengths = timeline_offsets(timelines_df)
+    repo = timelines_df.index.get_indexer(repos)
+    weeks = weeks.to_numpy(dtype=float) - timelines_df.min_week.to_numpy()[repo]
+    valid = (repo >= 0) & (weeks >= 0) & (weeks < lengths[repo])  # False for NaN
+    counts = np.bincount((offsets[repo] + weeks)[valid].astype(int), minlength=lengths.sum())
+    if cumulative:
+        totals = np.concatenate([[0], np.cumsum(counts)])
+        counts = totals[1:] - np.repeat(totals[offsets], lengths)  # restart at each repository
+    return counts
+
+def intern_identifiers(data):
+    """Convert repository IDs and user names into categoricals, so that they are grouped and merged by their integer codes. All datasets share one dictionary of repository IDs and one of user names (including authors and closing users). The dictionaries are sorted, so the codes are in the same order as the strings.
+
+    Args:
+        data (dict): maps dataset names to pd.DataFrame
+
+    Returns:
+        dict: same datasets with categorical identifier columns
+    """
+    for columns in IDENTIFIER_COLUMNS:
+        values = [df[column].dropna().unique() for df in data.values() for column in columns if column in df.columns]
+        dtype = pd.CategoricalDtype(pd.Index(np.concatenate(values)).unique().sort_values())
+        for df in data.values():
+            for column in columns:
+                if column in df.columns:
+                    df[column] = df[column].astype(dtype)
+    return data
+
+def decode_identifiers(df):
+    """Convert the categorical identifiers of an output dataset back to strings.
+
+    Args:
+        df (pd.DataFrame): output dataset from aggregate
+
+    Returns:
+        pd.DataFrame: same dataset with identifiers as strings
+    """
+    identifiers = [column for columns in IDENTIFIER_COLUMNS for column in columns]
+    for column in df.columns.intersection(identifiers):
+        df[column] = df[column].astype(object)
+    if isinstance(df.index, pd.MultiIndex):
+        df.index = df.index.remove_unused_levels()
+        df.index = df.index.set_levels([level.astype(object) if isinstance(level, pd.CategoricalIndex) else level for level in df.index.levels])
+    return df
+
+def load_datasets(githubdir, eprintsdir, file_format="csv", repos=None):
+    """Load all data needed for the aggregation.
+
+    Args:
+        githubdir (str): path to GitHub data directory
+        eprintsdir (str): path to ePrints data directory
+        file_format (str, optional): format of the GitHub data files, "csv" or "parquet". Defaults to "csv".
+        repos (list<str>, optional): only load the data of these repositories. Defaults to None.
+
+    Returns:
+        dict: maps dataset names to pd.DataFrame, with identifiers interned by intern_identifiers
+    """
+    return intern_identifiers({
+        "metadata": load_data(githubdir, f"metadata.{file_format}", "created_at", repos),
+        "contents": load_data(githubdir, f"contents.{file_format}", ["citation_added", "contributing_added"], repos),
+        "contributions": load_data(githubdir, f"contributions.{file_format}", "week_co", repos),
+        "forks": load_data(githubdir, f"forks.{file_format}", "date", repos),
+        "stars": load_data(githubdir, f"stars.{file_format}", "date", repos),
+        "issues": load_data(githubdir, f"issues.{file_format}", ["created_at", "closed_at"], repos),
+        "readme_history": load_data(githubdir, f"readme_history.{file_format}", "author_date", repos),
+        "paper_data": load_data(os.path.join(eprintsdir, "cleaned_repo_urls"), "joined.csv", "date", repos),
+    })
+
+def aggregate(data, verbose, expand_issue_users=False):
+    """Aggregate the data into the output datasets.
+
+    Args:
+        data (dict): maps dataset names to pd.DataFrame, as returned by load_datasets
+        verbose (bool): toggles verbose output
+        expand_issue_users (bool, optional): also determine the status of every issue user in every week. Defaults to False.
+
+    Returns:
+        dict: maps output dataset names to pd.DataFrame
+    """
+    metadata = data["metadata"]
+    outputs = {}
 
     info(verbose, "Preprocessing...")
-    contents = aggregate_week_since_repo_creation(metadata, contents, ["citation_added", "contributing_added"])
-    contributions = aggregate_week_since_repo_creation(metadata, contributions, "week_co")
-    forks = aggregate_week_since_repo_creation(metadata, forks, "date")
-    stars = aggregate_week_since_repo_creation(metadata, stars, "date")
-    issues = aggregate_week_since_repo_creation(metadata, issues, ["created_at", "closed_at"])
-    readme_history = aggregate_week_since_repo_creation(metadata, readme_history, "author_date")
+    contents = aggregate_week_since_repo_creation(metadata, data["contents"], ["citation_added", "contributing_added"])
+    contributions = aggregate_week_since_repo_creation(metadata, data["contributions"], "week_co")
+    forks = aggregate_week_since_repo_creation(metadata, data["forks"], "date")
+    stars = aggregate_week_since_repo_creation(metadata, data["stars"], "date")
+    issues = aggregate_week_since_repo_creation(metadata, data["issues"], ["created_at", "closed_at"])
+    readme_history = aggregate_week_since_repo_creation(metadata, data["readme_history"], "author_date")
     readme_history = clean_headings(readme_history)
-    paper_data = aggregate_week_since_repo_creation(metadata, paper_data, "date")
+    paper_data = aggregate_week_since_repo_creation(metadata, data["paper_data"], "date")
 
     info(verbose, "Aggregating overall...")
     contents = license_type(contents)
     contents = readme_size_classification(contents)
     engagement_df = engagement_counts(stars, forks)
-    contributors = team_size(contributions)
+    activity_df = contributor_activity(contributions, ["github_user_cleaned_url", "author"])
+    contributors = team_size(activity_df)
     print(contributors.reset_index())
-    max_active_contributors = contributors.reset_index().groupby("github_user_cleaned_url")["active_contributors"].max().rename("max_active_contributors")
-    overall_df = pd.merge(
-        pd.merge(
-            pd.merge(
-                metadata, contents,
-                on="github_user_cleaned_url",
-                how="left"
-            ), engagement_df,
-            on="github_user_cleaned_url",
-            how="left"
-        ), max_active_contributors,
-        how="left",
-        left_on="github_user_cleaned_url",
-        right_index=True
-    )
-    overall_df.to_csv(os.path.join(outdir, "aggregated_overall.csv"))
+    max_active_contributors = contributors.reset_index().groupby("github_user_cleaned_url", observed=True)["active_contributors"].max().rename("max_active_contributors")
+    # align the features of each repo, then join them to the metadata at once
+    features_df = pd.concat([
+        contents.set_index("github_user_cleaned_url"),
+        engagement_df.set_index("github_user_cleaned_url"),
+        max_active_contributors
+    ], axis=1)
+    overall_df = metadata.join(features_df, on="github_user_cleaned_url").reset_index(drop=True)
+    outputs["aggregated_overall"] = overall_df
     info(verbose, "Overall aggregation complete.")
 
     info(verbose, "Aggregating timelines...")
     readme_history = analyse_headings(readme_history)
-    timelines_df = timelines_init(metadata, contents, contributions, forks, stars, issues, readme_history)
-    issue_users_timeline_df = user_type_wrt_issues(issues, timelines_df)
-    commit_authors_timeline_df = user_type_wrt_commits(contributions)
-    issue_users_timeline_df.to_csv(os.path.join(outdir, "aggregated_issue_user_timeline.csv"))
-    commit_authors_timeline_df.to_csv(os.path.join(outdir, "aggregated_commit_author_timeline.csv"))
-    issue_counts_df = no_open_and_closed_issues(issues, timelines_df)
-    engagement_df = engagement(forks, stars, timelines_df)
-    highlights_df = date_highlights(readme_history, contents, paper_data, timelines_df)
-    contributors = pd.merge(timelines_df, contributors, how="left", left_index=True, right_index=True)
-    contributors.fillna(value={"active_contributors": 0, "contributors": 0}, inplace=True)
-    overall_timeline_df = pd.merge(
-        pd.merge(
-            pd.merge(
-                issue_counts_df, contributors,
-                left_index=True,
-                right_index=True,
-                how="left"
-            ), engagement_df,
-            left_index=True,
-            right_index=True,
-            how="left"
-        ), highlights_df,
-        left_index=True,
-        right_index=True,
-        how="left"
-    )
-    overall_timeline_df.to_csv(os.path.join(outdir, "aggregated_timeline.csv"))
+    timelines_df = timelines_init(metadata, contents, contributions, forks, stars, issues, readme_history).sort_index()
+    outputs["aggregated_issue_user_spans"] = user_type_wrt_issues(issues, timelines_df)
+    if expand_issue_users:
+        outputs["aggregated_issue_user_timeline"] = expand_user_type_wrt_issues(issues, timelines_df)
+    outputs["aggregated_commit_author_timeline"] = user_type_wrt_commits(activity_df)
+    # all weekly features share one index, so the timeline is assembled without aligning them again
+    index = timeline_index(timelines_df)
+    issue_counts_df = no_open_and_closed_issues(issues, timelines_df, index)
+    engagement_df = engagement(forks, stars, timelines_df, index)
+    highlights_df = date_highlights(readme_history, contents, paper_data, timelines_df, index)
+    contributors = contributors.reindex(index)
+    contributors = contributors.fillna(value={"active_contributors": 0, "contributors": 0}).astype(float)  # same type in every shard
+    overall_timeline_df = pd.concat([issue_counts_df, contributors, engagement_df, highlights_df], axis=1, copy=False)
+    outputs["aggregated_timeline"] = overall_timeline_df
     info(verbose, "Timeline aggregation complete.")
+    return {name: decode_identifiers(df) for name, df in outputs.items()}
+
+def aggregate_shard(githubdir, eprintsdir, file_format, expand_issue_users, repos, shard_dir, verbose):
+    """Aggregate the data of a subset of repositories. Outputs ordered by repository are written to CSV files in shard_dir, as they can be concatenated on disk.
+
+    Args:
+        githubdir (str): path to GitHub data directory
+        eprintsdir (str): path to ePrints data directory
+        file_format (str): format of the GitHub data files, "csv" or "parquet"
+        expand_issue_users (bool): also determine the status of every issue user in every week
+        repos (list<str>): repository IDs of the shard
+        shard_dir (str): path to directory for the output files of the shard
+        verbose (bool): toggles verbose output
+
+    Returns:
+        dict: maps names of the remaining output datasets to pd.DataFrame
+    """
+    info(verbose, f"Loading data of {len(repos)} repos...")
+    outputs = aggregate(load_datasets(githubdir, eprintsdir, file_format, repos), verbose, expand_issue_users)
+    for name in ["aggregated_commit_author_timeline", "aggregated_timeline"]:
+        outputs.pop(name).to_csv(os.path.join(shard_dir, f"{name}.csv"))
+    return outputs
+
+def output_repos(df):
+    """Get the repository of each row of an output dataset.
+
+    Args:
+        df (pd.DataFrame): output dataset from aggregate
+
+    Returns:
+        np.ndarray: repository IDs
+    """
+    if "github_user_cleaned_url" in df.columns:
+        return df["github_user_cleaned_url"].to_numpy()
+    return df.index.get_level_values("github_user_cleaned_url").to_numpy()
+
+def combine_outputs(name, dfs, repos):
+    """Combine parts of an output dataset that were aggregated separately, in the order of a single pass over all repositories.
+
+    Args:
+        name (str): name of the output dataset
+        dfs (list<pd.DataFrame>): parts of the output dataset, each with all rows of its repositories
+        repos (pd.Series): repository IDs in the order of the metadata
+
+    Returns:
+        pd.DataFrame: combined output dataset
+    """
+    df = pd.concat(dfs)
+    if name == "aggregated_overall":  # metadata order
+        df = df.infer_objects()  # columns without missing values in a part are read as int
+        return df.iloc[np.argsort(pd.Index(repos).get_indexer(output_repos(df)), kind="stable")].reset_index(drop=True)
+    repo = pd.Index(np.sort(repos.to_numpy())).get_indexer(output_repos(df))
+    if name in ["aggregated_issue_user_spans", "aggregated_issue_user_timeline"]:  # by user, then repo
+        user = pd.factorize(df.index.get_level_values("user"), sort=True)[0]
+        return df.iloc[np.lexsort((repo, user))]
+    return df.iloc[np.argsort(repo, kind="stable")]
+
+def fingerprint_datasets(githubdir, eprintsdir, file_format="csv"):
+    """Fingerprint the raw data of each repository, reading the data files in chunks.
+
+    Args:
+        githubdir (str): path to GitHub data directory
+        eprintsdir (str): path to ePrints data directory
+        file_format (str, optional): format of the GitHub data files, "csv" or "parquet". Defaults to "csv".
+
+    Returns:
+        pd.Series: hex digest for each repository ID
+    """
+    paths = [os.path.join(githubdir, f"{name}.{file_format}") for name in ["metadata", "contents", "contributions", "forks", "stars", "issues", "readme_history"]]
+    paths.append(os.path.join(eprintsdir, "cleaned_repo_urls", "joined.csv"))
+    fingerprints = {}
+    for path in paths:
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            f = pq.ParquetFile(path)
+            chunks = (f.read_row_group(i).to_pandas() for i in range(f.num_row_groups))
+        else:  # raw text, independent of the types pandas would infer
+            chunks = pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False, chunksize=100000)
+        for chunk in chunks:
+            for column in chunk.columns[chunk.dtypes == object]:
+                chunk[column] = chunk[column].map(lambda v: str(as_list(v)) if isinstance(v, np.ndarray) else v)
+            hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+            for repo, rows in chunk.groupby("github_user_cleaned_url", sort=False).indices.items():
+                fingerprints.setdefault(repo, hashlib.sha1()).update(os.path.basename(path).encode() + hashes[rows].tobytes())
+    return pd.Series({repo: h.hexdigest() for repo, h in fingerprints.items()}, dtype=object)
+
+def aggregate_incremental(githubdir, eprintsdir, outdir, verbose, file_format="csv", expand_issue_users=False):
+    """Aggregate only the repositories whose raw data changed since the last run and splice them into the cached outputs of the other repositories. Fingerprints and outputs are cached in the directory ".aggregate_cache" in outdir.
+
+    Args:
+        githubdir (str): path to GitHub data directory
+        eprintsdir (str): path to ePrints data directory
+        outdir (str): path to use for output data
+        verbose (bool): toggles verbose output
+        file_format (str, optional): format of the GitHub data files, "csv" or "parquet". Defaults to "csv".
+        expand_issue_users (bool, optional): also determine the status of every issue user in every week. Defaults to False.
+    """
+    cache_dir = os.path.join(outdir, ".aggregate_cache")
+    names = ["aggregated_overall", "aggregated_issue_user_spans", "aggregated_commit_author_timeline", "aggregated_timeline"]
+    if expand_issue_users:
+        names.append("aggregated_issue_user_timeline")
+    # results depend on the aggregation code as well
+    version = hashlib.sha1()
+    for path in [__file__, inspect.getfile(aggregate_week_since_repo_creation)]:
+        with open(path, "rb") as f:
+            version.update(f.read())
+    version = version.hexdigest()
+    info(verbose, "Fingerprinting data...")
+    repos = load_data(githubdir, f"metadata.{file_format}")["github_user_cleaned_url"].drop_duplicates()
+    fingerprints = fingerprint_datasets(githubdir, eprintsdir, file_format).reindex(repos)
+    cached = {}
+    cached_fingerprints = pd.Series(dtype=object)
+    if os.path.exists(os.path.join(cache_dir, "version")):
+        with open(os.path.join(cache_dir, "version"), "r") as f:
+            cache_version = f.read()
+        if cache_version == version and all(os.path.exists(os.path.join(cache_dir, f"{name}.pickle")) for name in names):
+            cached = {name: pd.read_pickle(os.path.join(cache_dir, f"{name}.pickle")) for name in names}
+            cached_fingerprints = pd.read_csv(os.path.join(cache_dir, "fingerprints.csv"), index_col=0)["fingerprint"]
+    changed = repos[(fingerprints != cached_fingerprints.reindex(repos)).to_numpy()]
+    info(verbose, f"{len(changed)} of {len(repos)} repos changed.")
+    if len(changed) == 0 and len(cached_fingerprints) == len(repos) and all(os.path.exists(os.path.join(outdir, f"{name}.csv")) for name in names):
+        return
+    outputs = {}
+    if len(changed) > 0:
+        outputs = aggregate(load_datasets(githubdir, eprintsdir, file_format, changed.to_list()), verbose, expand_issue_users)
+    info(verbose, "Combining with cached outputs...")
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in names:
+        parts = []
+        if name in cached:  # unchanged repos still in the data
+            df = cached[name]
+            df = df[np.isin(output_repos(df), repos[~repos.isin(changed)])]
+            if name == "aggregated_overall":  # counts are only float if a removed row had none
+                counts = [column for column in ["forks_count", "stars_count", "max_active_contributors"] if df[column].notna().all()]
+                df = df.astype({column: int for column in counts})
+            parts.append(df)
+        if name in outputs:
+            parts.append(outputs[name])
+        df = combine_outputs(name, parts, repos)
+        df.to_csv(os.path.join(outdir, f"{name}.csv"))
+        df.to_pickle(os.path.join(cache_dir, f"{name}.pickle"))
+    fingerprints.rename("fingerprint").to_csv(os.path.join(cache_dir, "fingerprints.csv"))
+    with open(os.path.join(cache_dir, "version"), "w") as f:
+        f.write(version)
+
+def main(githubdir, eprintsdir, outdir, verbose, file_format="csv", expand_issue_users=False, shards=1, processes=1, incremental=False):
+    if incremental:
+        aggregate_incremental(githubdir, eprintsdir, outdir, verbose, file_format, expand_issue_users)
+        return
+    if shards == 1:
+        info(verbose, f"Loading data...")
+        data = load_datasets(githubdir, eprintsdir, file_format)
+        info(verbose, "Data loading complete.")
+        outputs = aggregate(data, verbose, expand_issue_users)
+        for name, df in outputs.items():
+            df.to_csv(os.path.join(outdir, f"{name}.csv"))
+        return
+    # contiguous ranges of sorted repository IDs, so that outputs ordered by repository can be concatenated
+    repos = load_data(githubdir, f"metadata.{file_format}")["github_user_cleaned_url"].drop_duplicates()
+    repo_shards = [shard for shard in np.array_split(np.sort(repos.to_numpy()), shards) if len(shard) > 0]
+    with tempfile.TemporaryDirectory(dir=outdir) as tmpdir:
+        shard_dirs = [os.path.join(tmpdir, str(i)) for i in range(len(repo_shards))]
+        for shard_dir in shard_dirs:
+            os.makedirs(shard_dir)
+        args = [(githubdir, eprintsdir, file_format, expand_issue_users, shard, shard_dir, verbose) for shard, shard_dir in zip(repo_shards, shard_dirs)]
+        if processes > 1:
+            with ProcessPoolExecutor(processes) as executor:
+                results = [future.result() for future in [executor.submit(aggregate_shard, *a) for a in args]]
+        else:
+            results = [aggregate_shard(*a) for a in args]
+        info(verbose, "Combining shards...")
+        for name in ["aggregated_commit_author_timeline", "aggregated_timeline"]:
+            with open(os.path.join(outdir, f"{name}.csv"), "wb") as out:
+                for i, shard_dir in enumerate(shard_dirs):
+                    with open(os.path.join(shard_dir, f"{name}.csv"), "rb") as f:
+                        if i > 0:
+                            f.readline()  # header
+                        shutil.copyfileobj(f, out)
+    for name in results[0]:
+        combine_outputs(name, [r[name] for r in results], repos).to_csv(os.path.join(outdir, f"{name}.csv"))
 
 if __name__=="__main__":
     parser = argparse.ArgumentParser(
@@ -462,6 +827,13 @@ if __name__=="__main__":
     parser.add_argument("--githubdir", default="../../data/raw/github", type=str, help="path to GitHub data directory")
     parser.add_argument("--eprintsdir", default="../../data/raw/eprints", type=str, help="path to ePrints data directory")
     parser.add_argument("--outdir", default="../../data/derived", type=str, help="path to use for output data")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the GitHub data files")
+    parser.add_argument("--expand-issue-users", action="store_true", help="also write the status of every issue user in every week (aggregated_issue_user_timeline.csv)")
+    parser.add_argument("--shards", default=1, type=int, help="number of shards of repositories to aggregate one after the other, with only the data of one shard in memory")
+    parser.add_argument("-p", "--processes", default=1, type=int, help="number of shards to aggregate in parallel")
+    parser.add_argument("--incremental", action="store_true", help="only aggregate repositories whose data changed since the last run with this option and reuse the cached outputs of the others")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.githubdir, args.eprintsdir, args.outdir, args.verbose)
\ No newline at end of file
+    if args.incremental and args.shards > 1:
+        parser.error("--incremental cannot be combined with --shards")
+    main(args.githubdir, args.eprintsdir, args.outdir, args.verbose, args.format, args.expand_issue_users, args.shards, args.processes, args.incremental)
\ No newline at end of file
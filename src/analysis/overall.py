@@ -8,6 +8,7 @@ import re
 from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
 from matplotlib import pyplot as plt
 from datetime import datetime
+from utils import aggregate_week_since_repo_creation
 
 def info(verbose, msg):
     if verbose:
@@ -100,9 +101,9 @@ def plot_team_size(metadata, contributions, ax):
         contributions (pd.DataFrame): contributions (i.e. commit) data mined from GitHub
         ax (Axes): subplot to use
     """
-    contrib_df = pd.merge(metadata[["github_user_cleaned_url", "created_at"]], contributions)
     # add week timeline info
-    contrib_df["week_since_repo_creation"] = (contrib_df.week_co - contrib_df.created_at).dt.days // 7
+    contrib_df = aggregate_week_since_repo_creation(metadata, contributions, "week_co")
+    contrib_df.rename(columns={"week_since_repo_creation_week_co": "week_since_repo_creation"}, inplace=True)
     team_df = contrib_df[["github_user_cleaned_url", "author", "week_since_repo_creation", "commits"]].set_index(["github_user_cleaned_url", "author", "week_since_repo_creation"]).sort_index()
     # user is considered an active contributor if they made at least one commit in the last 12 weeks
     windowed_team_df = team_df.groupby(level="author").rolling(window=12, min_periods=0).sum().droplevel(0)
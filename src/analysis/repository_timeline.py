@@ -1,29 +1,75 @@
 import argparse
+import ast
+import io
 import pandas as pd
 import numpy as np
 import os
 import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone, timedelta
+import matplotlib
+matplotlib.use("Agg")  # plots are only written to files
 from matplotlib import pyplot as plt
+from utils import aggregate_week_since_repo_creation, contributor_activity, read_index
 
 def info(verbose, msg):
     if verbose:
         print(f"[INFO] {msg}")
 
+def read_repo_rows(path, repo):
+    """Read the rows of one repository from a data file, using the index next to the file (written by the scripts in src/github) to skip the rows of all other repositories.
+
+    Args:
+        path (str): path to CSV or Parquet (".parquet") file
+        repo (str): repository ID
+
+    Returns:
+        pd.DataFrame: rows of the repository, None if the file has no up-to-date index
+    """
+    index = read_index(path)
+    if index is None:
+        return None
+    ranges = index[index["github_user_cleaned_url"] == repo]
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        f = pq.ParquetFile(path)
+        group_sizes = [f.metadata.row_group(i).num_rows for i in range(f.num_row_groups)]
+        group_ends = np.cumsum(group_sizes)
+        tables = [f.schema_arrow.empty_table()]
+        for start, end in zip(ranges.start, ranges.end):
+            first = np.searchsorted(group_ends, start, side="right")
+            last = np.searchsorted(group_ends, end - 1, side="right")
+            table = f.read_row_groups(list(range(first, last + 1)))
+            tables.append(table.slice(start - (group_ends[first] - group_sizes[first]), end - start))
+        return pa.concat_tables(tables).to_pandas()
+    with open(path, "rb") as f:
+        data = [f.readline()]  # header
+        for start, end in zip(ranges.start, ranges.end):
+            f.seek(start)
+            data.append(f.read(end - start))
+    return pd.read_csv(io.BytesIO(b"".join(data)), index_col=0)
+
 def load_data(data_dir, filename, repo, to_datetime=None):
     """Filter data for the repository in question.
 
     Args:
         data_dir (str): directory with the data
-        filename (str): data file name
-        repo (str): repository ID
+        filename (str): data file name, CSV or Parquet (".parquet")
+        repo (str): repository ID, None to load the data of all repositories
         to_datetime (str | list, optional): name of column(s) to convert to pandas datetime type. Defaults to None.
 
     Returns:
-        pd.DataFrame: data loaded from CSV
+        pd.DataFrame: data loaded from file
     """
-    df = pd.read_csv(os.path.join(data_dir, filename), index_col=0)
-    df = df[df["github_user_cleaned_url"] == repo]
+    df = read_repo_rows(os.path.join(data_dir, filename), repo) if repo is not None else None
+    if df is None:  # no index, read whole file
+        if filename.endswith(".parquet"):  # datetime columns are already typed, lists are stored natively
+            df = pd.read_parquet(os.path.join(data_dir, filename))
+        else:
+            df = pd.read_csv(os.path.join(data_dir, filename), index_col=0)
+        if repo is not None:
+            df = df[df["github_user_cleaned_url"] == repo]
     if type(to_datetime) == list:
         for dt in to_datetime:
             df[dt] = pd.to_datetime(df[dt], utc=True)
@@ -31,6 +77,19 @@ def load_data(data_dir, filename, repo, to_datetime=None):
         df[to_datetime] = pd.to_datetime(df[to_datetime], utc=True)
     return df
 
+def as_list(value):
+    """Read a list from a README history column, stored natively in Parquet files and as its Python representation in CSV files.
+
+    Args:
+        value (str | np.ndarray): column value
+
+    Returns:
+        list: the list
+    """
+    if type(value) == str:
+        return ast.literal_eval(value)
+    return list(value)
+
 def analyse_headings(df):
     """Filter README headings for words relating to ownership or usage (vocabulary manually defined).
 
@@ -44,48 +103,41 @@ def analyse_headings(df):
         "ownership": ["license", "example", "reference", "citation", "cited", "publication", "paper"],
         "usage": ["requirements", "using", "example", "usage", "run", "install", "installing", "installation", "tutorial", "tutorials", "build", "guide", "documentation"]
     }
+    df["added_headings"] = df.added_headings.map(lambda l: l if type(l) == str else str(as_list(l)), na_action="ignore")  # match against the list representation
     df["ownership_addition"] = df.added_headings.str.contains("|".join(interesting_words["ownership"]), case=False)
     df["usage_addition"] = df.added_headings.str.contains("|".join(interesting_words["usage"]), case=False)
     return df
 
-def engagement_user_highlights(users, metadata, forks, stars, ax):
+def engagement_user_highlights(users, forks, stars, ax):
     """Plots when specific users forked or starred the repository.
 
     Args:
         users (list[str]): list of GitHub user names to consider
-        metadata (pd.DataFrame): metadata mined from GitHub
-        forks (pd.DataFrame): fork data mined from GitHub
-        stars (pd.DataFrame): star data mined from GitHub
+        forks (pd.DataFrame): fork data mined from GitHub, with weeks since repo creation
+        stars (pd.DataFrame): star data mined from GitHub, with weeks since repo creation
         ax (Axes): subplot to use
     """
-    # convert dates to repository age in weeks
-    user_forks = pd.merge(forks[forks.user.isin(users)], metadata, on="github_user_cleaned_url")
-    user_forks["week_since_repo_creation"] = (user_forks.date - user_forks.created_at).dt.days // 7
-    user_stars = pd.merge(stars[stars.user.isin(users)], metadata, on="github_user_cleaned_url")
-    user_stars["week_since_repo_creation"] = (user_stars.date - user_stars.created_at).dt.days // 7
-    ax.scatter(user_forks.week_since_repo_creation, user_forks.user, marker="v", s=100, label="forked")
-    ax.scatter(user_stars.week_since_repo_creation, user_stars.user, marker="v", s=100, label="starred")
+    user_forks = forks[forks.user.isin(users)]
+    user_stars = stars[stars.user.isin(users)]
+    ax.scatter(user_forks.week_since_repo_creation_date, user_forks.user, marker="v", s=100, label="forked")
+    ax.scatter(user_stars.week_since_repo_creation_date, user_stars.user, marker="v", s=100, label="starred")
 
 def user_type_wrt_issues(issues, metadata, forks, stars, analysis_end_date, ax):
     """Plot every user's issue interaction type (opening issues, closing issues, both) with engagement highlight dates scattered on top.
 
     Args:
-        issues (pd.DataFrame): issues data mined from GitHub
+        issues (pd.DataFrame): issues data mined from GitHub, with weeks since repo creation
         metadata (pd.DataFrame): metadata mined from GitHub
-        forks (pd.DataFrame): forks data mined from GitHub
-        stars (pd.DataFrame): stars data mined from GitHub
+        forks (pd.DataFrame): forks data mined from GitHub, with weeks since repo creation
+        stars (pd.DataFrame): stars data mined from GitHub, with weeks since repo creation
         analysis_end_date (datetime.datetime): end date of the plot, usually the date the GitHub mining process was complete
         ax (Axes): subplot to use
     """
-    # map dates to weeks
-    merged_df = pd.merge(issues, metadata, on="github_user_cleaned_url", suffixes=(None,"_repo"))
-    merged_df["created_at"] = (merged_df["created_at"] - merged_df["created_at_repo"]).dt.days // 7
-    merged_df["closed_at"] = (merged_df["closed_at"] - merged_df["created_at_repo"]).dt.days // 7
     # count number of created and closed issues by user + week
-    created = merged_df.groupby(["user", "created_at"])["state"].count().rename("created_count")
-    created.index.rename({"created_at": "week_since_repo_creation"}, inplace=True)
-    closed = merged_df.groupby(["closed_by", "closed_at"])["state"].count().rename("closed_count")
-    closed.index.rename({"closed_at": "week_since_repo_creation", "closed_by": "user"}, inplace=True)
+    created = issues.groupby(["user", "week_since_repo_creation_created_at"])["state"].count().rename("created_count")
+    created.index.rename({"week_since_repo_creation_created_at": "week_since_repo_creation"}, inplace=True)
+    closed = issues.groupby(["closed_by", "week_since_repo_creation_closed_at"])["state"].count().rename("closed_count")
+    closed.index.rename({"week_since_repo_creation_closed_at": "week_since_repo_creation", "closed_by": "user"}, inplace=True)
     issues_by_user = pd.merge(created, closed, left_index=True, right_index=True, how="outer")
     # build timeline DataFrame
     end = (analysis_end_date - metadata.created_at.iloc[0]).days // 7
@@ -112,26 +164,21 @@ def user_type_wrt_issues(issues, metadata, forks, stars, analysis_end_date, ax):
         )
     ax.set_ylabel("issue user")
     users = np.unique(np.concatenate([issues.user.unique(), issues.closed_by.dropna().unique()]))
-    engagement_user_highlights(users, metadata, forks, stars, ax)
+    engagement_user_highlights(users, forks, stars, ax)
 
-def contributor_team(contributions, metadata, forks, stars, axs):
+def contributor_team(contributions, forks, stars, axs):
     """Plot every user's contributing type (active vs. inactive), with engagement highlight dates scattered on top.
 
     Args:
-        contributions (pd.DataFrame): contribution (i.e. commits) data mined from GitHub
-        metadata (pd.DataFrame): metadata mined from GitHub
-        forks (pd.DataFrame): forks data mined from GitHub
-        stars (pd.DataFrame): stars data mined from GitHub
+        contributions (pd.DataFrame): contribution (i.e. commits) data mined from GitHub, with weeks since repo creation
+        forks (pd.DataFrame): forks data mined from GitHub, with weeks since repo creation
+        stars (pd.DataFrame): stars data mined from GitHub, with weeks since repo creation
         axs (list[Axes]): suplots to use (expecting two)
     """
-    # map dates to weeks
-    contrib_df = pd.merge(metadata[["github_user_cleaned_url", "created_at"]], contributions)
-    contrib_df["week_since_repo_creation"] = (contrib_df.week_co - contrib_df.created_at).dt.days // 7
-    team_df = contrib_df[["author", "week_since_repo_creation", "commits"]].set_index(["author", "week_since_repo_creation"]).sort_index()
     # user is active contributor if made at least one commit in last 12 weeks
-    windowed_team_df = team_df.groupby(level="author").rolling(window=12, min_periods=0).sum().droplevel(0)
-    windowed_team_df["active contributors"] = windowed_team_df.commits > 0
-    windowed_team_df["active contributors"] = windowed_team_df["active contributors"].map({True: "active", False: "inactive"})
+    activity_df = contributor_activity(contributions, ["author"])
+    windowed_team_df = activity_df[["commits"]].copy()
+    windowed_team_df["active contributors"] = activity_df.active_contributors.map({True: "active", False: "inactive"})
     # plot per-user status
     sns.scatterplot(
         ax=axs[0],
@@ -146,9 +193,9 @@ def contributor_team(contributions, metadata, forks, stars, axs):
     )
     axs[0].set_ylabel("contributing user")
     users = contributions.author.unique()
-    engagement_user_highlights(users, metadata, forks, stars, axs[0])
+    engagement_user_highlights(users, forks, stars, axs[0])
     # team size
-    team_size = windowed_team_df.groupby(level="week_since_repo_creation")["active contributors"].value_counts()[:,"active"].reindex(windowed_team_df.index.levels[1], fill_value=0)
+    team_size = activity_df.groupby(level="week_since_repo_creation")["active_contributors"].sum().rename("active contributors")
     # plot
     team_size.plot(
         ax=axs[1],
@@ -157,40 +204,43 @@ def contributor_team(contributions, metadata, forks, stars, axs):
         ylabel="number of contributors",
     )
     # overall pool of contributors
-    contributor_pool_df = team_df.groupby(level="author").cumsum()
-    contributor_pool_df["contributors"] = contributor_pool_df.commits > 0
-    contrib_pool = contributor_pool_df.groupby(level="week_since_repo_creation")["contributors"].value_counts()[:,True].reindex(contributor_pool_df.index.levels[1], fill_value=0)
+    contrib_pool = activity_df.groupby(level="week_since_repo_creation")["contributors"].sum()
     contrib_pool.plot(
         ax=axs[1],
         lw=2,
     )
 
+def count_events_until(event_weeks, weeks):
+    """Count the events that happened in or before each week.
+
+    Args:
+        event_weeks (np.ndarray): week of each event, NaN for events that did not happen
+        weeks (pd.Series): weeks to count the events for
+
+    Returns:
+        np.ndarray: number of events per week
+    """
+    event_weeks = np.sort(event_weeks[~np.isnan(event_weeks)])
+    return np.searchsorted(event_weeks, weeks.to_numpy(), side="right")
+
 def no_open_and_closed_issues(issues, metadata, analysis_end_date, ax):
     """Plot the number of closed and open issues over time.
 
     Args:
-        issues (pd.DataFrame): issues data mined from GitHub
+        issues (pd.DataFrame): issues data mined from GitHub, with weeks since repo creation
         metadata (pd.DataFrame): metadata mined from GitHub
         analysis_end_date (datetime.datetime): end date of the plot, usually the date the GitHub mining process was complete
         ax (Axes): subplot to use
     """
-    # reframe timeline in terms of week since repo creation
-    issues_timeline_df = pd.merge(metadata, issues, on="github_user_cleaned_url", suffixes=("_repo", None))
-    issues_timeline_df["opened_in_week_since_repo_creation"] = (issues_timeline_df.created_at - issues_timeline_df.created_at_repo).dt.days // 7
-    issues_timeline_df["closed_in_week_since_repo_creation"] = (issues_timeline_df.closed_at - issues_timeline_df.created_at_repo).dt.days // 7
     # build weekly dataframe
     end = (analysis_end_date - metadata.created_at.iloc[0]).days // 7
     x_data = pd.Series(np.arange(end), name="week_since_repo_creation")
     issue_count_timeline = pd.DataFrame(x_data)
-    # count issues
-    issue_count_timeline["open_issues_count"] = issue_count_timeline.apply(lambda x: len(issues_timeline_df[
-                                                                                            (issues_timeline_df.opened_in_week_since_repo_creation <= x.week_since_repo_creation) &
-                                                                                            ((issues_timeline_df.closed_in_week_since_repo_creation >= x.week_since_repo_creation) |
-                                                                                             (issues_timeline_df.closed_in_week_since_repo_creation.isna()))
-                                                                                            ]), axis=1)
-    issue_count_timeline["closed_issues_count"] = issue_count_timeline.apply(lambda x: len(issues_timeline_df[
-                                                                                            (issues_timeline_df.closed_in_week_since_repo_creation < x.week_since_repo_creation)
-                                                                                            ]), axis=1)
+    # count issues: open in a week if opened in or before it and not closed before it
+    opened = issues.week_since_repo_creation_created_at.to_numpy(dtype=float)
+    closed = issues.week_since_repo_creation_closed_at.to_numpy(dtype=float)
+    issue_count_timeline["open_issues_count"] = count_events_until(opened, x_data) - count_events_until(np.maximum(opened, closed + 1), x_data)
+    issue_count_timeline["closed_issues_count"] = count_events_until(closed + 1, x_data)
     # plot
     issue_count_timeline.rename(columns={"open_issues_count": "open issues", "closed_issues_count": "closed issues"}).plot(
         ax=ax,
@@ -205,19 +255,17 @@ def engagement(forks, stars, metadata, analysis_end_date, ax):
     """Plot engagement indicators over time.
 
     Args:
-        forks (pd.DataFrame): forks data mined from GitHub
-        stars (pd.DataFrame): stars data mined from GitHub
+        forks (pd.DataFrame): forks data mined from GitHub, with weeks since repo creation
+        stars (pd.DataFrame): stars data mined from GitHub, with weeks since repo creation
         metadata (pd.DataFrame): metadata mined from GitHub
         analysis_end_date (datetime.datetime): end date of the plot, usually the date the GitHub mining process was complete
         ax (Axes): subplot to use
     """
     # reframe forks and star events into a weekly timeline
-    forks_df = pd.merge(forks, metadata, on="github_user_cleaned_url")
-    forks_df["week_since_repo_creation"] = (forks_df.date - forks_df.created_at).dt.days // 7
-    forks_df = forks_df[["week_since_repo_creation", "user"]].groupby("week_since_repo_creation").count().rename(columns={"user": "no forks"}).sort_index()
-    stars_df = pd.merge(stars, metadata, on="github_user_cleaned_url")
-    stars_df["week_since_repo_creation"] = (stars_df.date - stars_df.created_at).dt.days // 7
-    stars_df = stars_df[["week_since_repo_creation", "user"]].groupby("week_since_repo_creation").count().rename(columns={"user": "no stars"}).sort_index()
+    forks_df = forks[["week_since_repo_creation_date", "user"]].groupby("week_since_repo_creation_date").count().rename(columns={"user": "no forks"}).sort_index()
+    forks_df.index.rename("week_since_repo_creation", inplace=True)
+    stars_df = stars[["week_since_repo_creation_date", "user"]].groupby("week_since_repo_creation_date").count().rename(columns={"user": "no stars"}).sort_index()
+    stars_df.index.rename("week_since_repo_creation", inplace=True)
     # line plot
     end = (analysis_end_date - metadata.created_at.iloc[0]).days // 7
     x_data = pd.Series(np.arange(end), name="week_since_repo_creation")
@@ -248,37 +296,29 @@ def calc_y_timeline(data):
             seen_x.append(x)
     return ys
 
-def date_highlights(readme_history, contents, metadata, paper_data, ax, overlay_ax):
+def date_highlights(readme_history, contents, paper_data, ax, overlay_ax):
     """Plot highlight dates over time.
 
     Args:
-        readme_history (pd.DataFrame): README commit history mined from GitHub
-        contents (pd.DataFrame): content data mined from GitHub
-        metadata (pd.DataFrame): metadata mined from GitHub
-        paper_data (pd.DataFrame): publication data mined from ePrints
+        readme_history (pd.DataFrame): README commit history mined from GitHub, with weeks since repo creation
+        contents (pd.DataFrame): content data mined from GitHub, with weeks since repo creation
+        paper_data (pd.DataFrame): publication data mined from ePrints, with weeks since repo creation
         ax (Axes): subplot to use
         overlay_ax (Axes): main plot, used for top-bottom dotted lines
     """
-    df = pd.merge(metadata, readme_history, on="github_user_cleaned_url")
-    df.dropna(subset=["author_date"], inplace=True)
-    df["authored_in_week_since_creation"] = (df.author_date - df.created_at).dt.days // 7
-    contents_df = pd.merge(metadata, contents, on="github_user_cleaned_url")
-    contents_df.citation_added = (contents_df.citation_added - contents_df.created_at).dt.days // 7
-    contents_df.contributing_added = (contents_df.contributing_added - contents_df.created_at).dt.days // 7
-    paper_df = pd.merge(metadata, paper_data, on="github_user_cleaned_url")
-    paper_df.date = (paper_df.date - paper_df.created_at).dt.days // 7
+    df = readme_history.dropna(subset=["author_date"])
     # headings
     df = analyse_headings(df)    
-    ownership_added = df[df.ownership_addition].authored_in_week_since_creation
-    usage_added = df[df.usage_addition].authored_in_week_since_creation
+    ownership_added = df[df.ownership_addition].week_since_repo_creation_author_date
+    usage_added = df[df.usage_addition].week_since_repo_creation_author_date
     # citation in README
-    citation_added = df[(df.added_cites != "[]") & (df.added_cites.notna())].authored_in_week_since_creation
+    citation_added = df[df.added_cites.map(lambda l: len(as_list(l)) > 0, na_action="ignore") == True].week_since_repo_creation_author_date
     # citation file
-    citation_file_added = contents_df[contents_df.citation_added.notna()].citation_added
+    citation_file_added = contents[contents.week_since_repo_creation_citation_added.notna()].week_since_repo_creation_citation_added
     # contributing file
-    contributing_file_added = contents_df[contents_df.contributing_added.notna()].contributing_added
+    contributing_file_added = contents[contents.week_since_repo_creation_contributing_added.notna()].week_since_repo_creation_contributing_added
     # paper publication
-    paper_published = paper_df[paper_df.date.notna()].date
+    paper_published = paper_data[paper_data.week_since_repo_creation_date.notna()].week_since_repo_creation_date
     # plotting
     ax.set(ylim=(-6, 0.4), yticks=[])
     ax.set_xlabel("weeks since repository creation", loc="right")
@@ -297,23 +337,74 @@ def date_highlights(readme_history, contents, metadata, paper_data, ax, overlay_
         ax.scatter(data[i], ys[i], marker="^", s=100, label=labels[i], color=colors[i])
         overlay_ax.vlines(data[i], ys[i], ymax, linestyles='dashed', color=colors[i])
 
-def main(repo, githubdir, eprintsdir, output_dir, verbose):
-    info(verbose, f"Loading data for repo {repo}...")
-    contents = load_data(githubdir, "contents.csv", repo, ["citation_added", "contributing_added"])
-    contributions = load_data(githubdir, "contributions.csv", repo, "week_co")
-    forks = load_data(githubdir, "forks.csv", repo, "date")
-    issues = load_data(githubdir, "issues.csv", repo, ["created_at", "closed_at"])
-    metadata = load_data(githubdir, "metadata.csv", repo, "created_at")
-    readme_history = load_data(githubdir, "readme_history.csv", repo, "author_date")
-    stars = load_data(githubdir, "stars.csv", repo, "date")
-    paper_data = load_data(os.path.join(eprintsdir, "cleaned_repo_urls"), "joined.csv", repo, "date")
-    info(verbose, "Data loading complete.")
+def load_datasets(githubdir, eprintsdir, repo, file_format="csv"):
+    """Load all data needed for the timeline plots.
+
+    Args:
+        githubdir (str): path to GitHub data directory
+        eprintsdir (str): path to ePrints data directory
+        repo (str): repository ID, None to load the data of all repositories
+        file_format (str, optional): format of the GitHub data files, "csv" or "parquet". Defaults to "csv".
+
+    Returns:
+        dict: maps dataset names to pd.DataFrame
+    """
+    return {
+        "contents": load_data(githubdir, f"contents.{file_format}", repo, ["citation_added", "contributing_added"]),
+        "contributions": load_data(githubdir, f"contributions.{file_format}", repo, "week_co"),
+        "forks": load_data(githubdir, f"forks.{file_format}", repo, "date"),
+        "issues": load_data(githubdir, f"issues.{file_format}", repo, ["created_at", "closed_at"]),
+        "metadata": load_data(githubdir, f"metadata.{file_format}", repo, "created_at"),
+        "readme_history": load_data(githubdir, f"readme_history.{file_format}", repo, "author_date"),
+        "stars": load_data(githubdir, f"stars.{file_format}", repo, "date"),
+        "paper_data": load_data(os.path.join(eprintsdir, "cleaned_repo_urls"), "joined.csv", repo, "date"),
+    }
+
+def split_datasets(data, repos):
+    """Split the data of all repositories into the data of each repository.
+
+    Args:
+        data (dict): maps dataset names to pd.DataFrame, as returned by load_datasets
+        repos (list<str>): repository IDs
+
+    Returns:
+        dict: maps repository IDs to the data of the repository, in the same form as data
+    """
+    groups = {name: dict(tuple(df.groupby("github_user_cleaned_url", sort=False))) for name, df in data.items()}
+    return {repo: {name: groups[name].get(repo, df.iloc[:0]) for name, df in data.items()} for repo in repos}
+
+def plot_timeline(repo, data, output_dir, verbose):
+    """Plot the timeline of one repository and save it as PNG.
+
+    Args:
+        repo (str): repository ID
+        data (dict): maps dataset names to pd.DataFrame with the data of the repository, as returned by load_datasets
+        output_dir (str): path to the output directory
+        verbose (bool): toggles verbose output
+    """
+    contents = data["contents"]
+    contributions = data["contributions"]
+    forks = data["forks"]
+    issues = data["issues"]
+    metadata = data["metadata"]
+    readme_history = data["readme_history"]
+    stars = data["stars"]
+    paper_data = data["paper_data"]
 
     analysis_end_date = contributions.week_co.max() + timedelta(days=7)
 
     if len(metadata) == 0:
         info(verbose, f"Not enough data available for {repo}.")
-        exit()
+        return
+
+    # map dates to weeks since repo creation
+    contents = aggregate_week_since_repo_creation(metadata, contents, ["citation_added", "contributing_added"])
+    contributions = aggregate_week_since_repo_creation(metadata, contributions, "week_co")
+    forks = aggregate_week_since_repo_creation(metadata, forks, "date")
+    issues = aggregate_week_since_repo_creation(metadata, issues, ["created_at", "closed_at"])
+    readme_history = aggregate_week_since_repo_creation(metadata, readme_history, "author_date")
+    stars = aggregate_week_since_repo_creation(metadata, stars, "date")
+    paper_data = aggregate_week_since_repo_creation(metadata, paper_data, "date")
 
     fig = plt.figure(figsize=(20, 20))
     overlay_axis = fig.subplots()
@@ -325,7 +416,7 @@ def main(repo, githubdir, eprintsdir, output_dir, verbose):
     user_type_wrt_issues(issues, metadata, forks, stars, analysis_end_date, axs[0])
     axs[0].legend(loc="upper right")
     axs[0].grid(True, axis="x")
-    contributor_team(contributions, metadata, forks, stars, axs[1:3])
+    contributor_team(contributions, forks, stars, axs[1:3])
     axs[1].grid(True, axis="x")
     axs[1].legend()
     axs[2].legend(loc="upper right")
@@ -336,7 +427,7 @@ def main(repo, githubdir, eprintsdir, output_dir, verbose):
     engagement(forks, stars, metadata, analysis_end_date, axs[4])
     axs[4].legend(loc="upper right")
     axs[4].grid(True)    
-    date_highlights(readme_history, contents, metadata, paper_data, axs[5], overlay_axis)
+    date_highlights(readme_history, contents, paper_data, axs[5], overlay_axis)
     axs[5].legend(loc="upper right", ncols=2)
     # final adjustments
     ymax = 86
@@ -346,20 +437,51 @@ def main(repo, githubdir, eprintsdir, output_dir, verbose):
     fig.suptitle(repo)
     s = repo.replace("/", "-")
     fig.tight_layout(rect=[0, 0.03, 1, 0.98])
-    outpath = os.path.join(dir, output_dir)
-    os.makedirs(outpath, exist_ok=True)
-    plt.savefig(os.path.join(outpath, f"{s}.png"), bbox_inches="tight")
-    info(verbose, f"Plot saved in {outpath}, file {s}.png.")
+    os.makedirs(output_dir, exist_ok=True)
+    plt.savefig(os.path.join(output_dir, f"{s}.png"), bbox_inches="tight")
+    plt.close(fig)
+    info(verbose, f"Plot saved in {output_dir}, file {s}.png.")
+
+def main(repo, githubdir, eprintsdir, output_dir, verbose, file_format="csv"):
+    info(verbose, f"Loading data for repo {repo}...")
+    data = load_datasets(githubdir, eprintsdir, repo, file_format)
+    info(verbose, "Data loading complete.")
+    plot_timeline(repo, data, output_dir, verbose)
+
+def main_batch(repos_path, githubdir, eprintsdir, output_dir, verbose, file_format="csv", processes=1):
+    with open(repos_path, "r") as f:
+        repos = [line.rstrip() for line in f]
+    repos = list(dict.fromkeys(r for r in repos if r))  # skip blank lines and duplicates
+    info(verbose, f"Loading data for {len(repos)} repos...")
+    data = load_datasets(githubdir, eprintsdir, None, file_format)
+    repo_data = split_datasets(data, repos)
+    del data
+    info(verbose, "Data loading complete.")
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(plot_timeline, repo, repo_data.pop(repo), output_dir, verbose) for repo in repos]
+            for future in futures:
+                future.result()
+    else:
+        for repo in repos:
+            plot_timeline(repo, repo_data.pop(repo), output_dir, verbose)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog="repository_timeline",
         description="Plot repository events and development on timeline."
     )
-    parser.add_argument("--repo", required=True, type=str, help="GitHub ID")
+    repo_group = parser.add_mutually_exclusive_group(required=True)
+    repo_group.add_argument("--repo", type=str, help="GitHub ID")
+    repo_group.add_argument("--repos-file", type=str, help="path to a txt file with one GitHub ID per line, to plot all of them in one run")
     parser.add_argument("--githubdir", default="../../data/raw/github", type=str, help="path to GitHub data directory")
     parser.add_argument("--eprintsdir", default="../../data/raw/eprints", type=str, help="path to ePrints data directory")
     parser.add_argument("--outdir", default="../../data/derived/plots/repo_timelines/true_positives", type=str, help="path to the output directory")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the GitHub data files")
+    parser.add_argument("-p", "--processes", default=1, type=int, help="number of processes plotting repositories in parallel with --repos-file")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.repo, args.githubdir, args.eprintsdir, args.outdir, args.verbose)
\ No newline at end of file
+    if args.repos_file is not None:
+        main_batch(args.repos_file, args.githubdir, args.eprintsdir, args.outdir, args.verbose, args.format, args.processes)
+    else:
+        main(args.repo, args.githubdir, args.eprintsdir, args.outdir, args.verbose, args.format)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+WEEK = np.timedelta64(7, "D").astype("timedelta64[ns]").astype(np.int64)
+NAT = np.iinfo(np.int64).min
+
+def read_index(path):
+    """Read the index next to a data file (written by the scripts in src/github), listing where the rows of each repository are in the file.
+
+    Args:
+        path (str): path to CSV or Parquet (".parquet") file
+
+    Returns:
+        pd.DataFrame: index with columns "github_user_cleaned_url", "start", "end", None if the file has no index or has changed since it was indexed
+    """
+    if not os.path.exists(path + ".index"):
+        return None
+    stat = os.stat(path)
+    recorded = None
+    if os.path.exists(path + ".index.json"):
+        with open(path + ".index.json") as f:
+            recorded = json.load(f)
+    if recorded != {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+        print(f"[WARNING] {path} has changed since it was indexed, reading the whole file. Run index_datasets.py in src/github to index it again.")
+        return None
+    return pd.read_csv(path + ".index")
+
+def bin_weeks(dates, created_at):
+    """Count the full weeks between two arrays of timestamps, like (dates - created_at).dt.days // 7.
+
+    Args:
+        dates (np.ndarray): timestamps as int64 nanoseconds, NaT as the smallest int64
+        created_at (np.ndarray): timestamps of repository creation as int64 nanoseconds
+
+    Returns:
+        np.ndarray: weeks as int64, or as float64 with NaN for NaT if there is any
+    """
+    weeks = (dates - created_at) // WEEK
+    missing = (dates == NAT) | (created_at == NAT)
+    if missing.any():
+        weeks = np.where(missing, np.nan, weeks)
+    return weeks
+
+def aggregate_week_since_repo_creation(metadata, df, label=None):
+    """Translate date columns into weeks since repo creation. Rows of repositories without metadata are dropped.
+
+    Args:
+        metadata (pd.DataFrame): dataframe with columns "github_user_cleaned_url" and "created_at"
+        df (pd.DataFrame): dataframe that should be aggregated
+        label (list<str> | str, optional): column name(s) with date information
+
+    Returns:
+        pd.DataFrame: input dataframe with added columns "repo_created_at" and "week_since_repo_creation_{original_column_name}"
+    """
+    repos = metadata.drop_duplicates("github_user_cleaned_url")
+    position = pd.Index(repos["github_user_cleaned_url"]).get_indexer(df["github_user_cleaned_url"])
+    df = df[position >= 0].reset_index(drop=True)
+    position = position[position >= 0]
+    df["repo_created_at"] = repos["created_at"].array.take(position)
+    created_at = repos["created_at"].values.view(np.int64)[position]
+    if type(label) == str:
+        label = [label]
+    for column in label or []:
+        df[f"week_since_repo_creation_{column}"] = bin_weeks(df[column].values.view(np.int64), created_at)
+    return df
+
+def contributor_activity(contributions, keys):
+    """Determine for each contributor and week the number of commits in the last 12 weeks, whether they are an active contributor (at least one commit in the last 12 weeks) and whether they have contributed yet. Uses differences of prefix sums over the weeks of each contributor, sorted by key and week.
+
+    Args:
+        contributions (pd.DataFrame): dataframe with GitHub commit data, with column "week_since_repo_creation_week_co"
+        keys (list<str>): columns identifying a contributor, e.g. ["github_user_cleaned_url", "author"]
+
+    Returns:
+        pd.DataFrame: dataframe with columns "commits", "active_contributors", "contributors" for each contributor and week, indexed by keys and "week_since_repo_creation"
+    """
+    team_df = contributions[keys + ["week_since_repo_creation_week_co", "commits"]].rename(columns={"week_since_repo_creation_week_co": "week_since_repo_creation"}).set_index(keys + ["week_since_repo_creation"]).sort_index()
+    index = team_df.index
+    weeks = index.get_level_values("week_since_repo_creation").to_numpy().astype(np.int64)
+    # number each contributor, in order
+    first = np.zeros(len(index), dtype=bool)
+    first[:1] = True
+    for codes in index.codes[:-1]:
+        first[1:] |= codes[1:] != codes[:-1]
+    contributor = np.cumsum(first) - 1
+    contributor_start = np.flatnonzero(first)[contributor]
+    # sorted positions in which the weeks of different contributors are more than 12 weeks apart
+    min_week = weeks.min(initial=0)
+    positions = contributor * (weeks.max(initial=0) - min_week + 12) + weeks - min_week
+    window_start = np.searchsorted(positions, positions - 11)
+    totals = np.concatenate([[0], np.cumsum(team_df.commits.to_numpy())])
+    activity_df = pd.DataFrame({"commits": (totals[1:] - totals[window_start]).astype(float)}, index=index)
+    activity_df["active_contributors"] = activity_df.commits > 0
+    activity_df["contributors"] = totals[1:] - totals[contributor_start] > 0
+    return activity_df
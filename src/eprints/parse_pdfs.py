@@ -2,51 +2,437 @@ import requests
 import re
 import os
 import argparse
+import csv
+import fcntl
+import gzip
+import hashlib
+import itertools
+import json
 import resource
+import tempfile
+import threading
+import time
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from io import BytesIO
+from urllib.parse import urlparse
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer
 
-def get_domain_urls(row, domain, verbose):
-    """Downloads file and yields matches of URLs of the domain found in it if it's a PDF.
+MAX_PDF_SIZE = 5e7  # ignore files larger than 50 MB to avoid OOM error
+def limit_memory(limit):
+    """Caps the address space of the current process, so that parsing a PDF that runs out of memory fails with a MemoryError instead of taking down the machine. Used to initialise parsing processes.
 
     Args:
-        row (pd.Series): contains columns for PDF url
+        limit (int): maximum address space in bytes, None for no limit
+    """
+    if limit is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+class HostLimiter:
+    """Limits the number of concurrent downloads from each host, to be polite to the ePrints servers.
+
+    Args:
+        limit (int): maximum number of concurrent downloads per host
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        """Gets the semaphore of the host of a URL, to hold while downloading from it.
+
+        Args:
+            url (str): URL to download
+
+        Returns:
+            threading.BoundedSemaphore: semaphore of the host
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            return self._semaphores.setdefault(host, threading.BoundedSemaphore(self.limit))
+
+class PDFCache:
+    """On-disk cache of downloaded PDFs, so that re-running the extraction does not download them again.
+    Files are stored under the SHA-256 hash of their content, so that a PDF linked from several URLs is stored once. An index maps each URL to its file, the validators sent by the server (ETag, Last-Modified) and the time it was last used. Index updates are appended to the index file as they happen, so that an interrupted run keeps what it downloaded, and the index is compacted on opening and closing the cache. Once the files take more space than the size limit, the least recently used ones are evicted.
+    The text extracted from each PDF is stored next to it, compressed, so that scanning the cached PDFs for another domain does not parse them again. It is evicted together with the PDF.
+    The cache directory is locked while the cache is open, as opening it removes files missing from the index, which could be in the middle of being written by another run.
+
+    Args:
+        path (str): cache directory
+        max_size (int): maximum total size of the cached files in bytes
+
+    Raises:
+        RuntimeError: if the cache directory is in use by another run
+    """
+    columns = ['pdf_url', 'sha256', 'size', 'etag', 'last_modified', 'last_used']
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(path, "index.csv")
+        self._entries = {}  # URL -> dict with the index columns
+        self._sizes = {}  # SHA-256 hash -> size of the cached file
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, "lock"), "w")  # released by close
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"The PDF cache {path} is in use by another run, use another cache directory for runs in parallel.")
+        os.makedirs(os.path.join(path, "files"), exist_ok=True)
+        os.makedirs(os.path.join(path, "text"), exist_ok=True)
+        if os.path.exists(self._index_path):
+            index = pd.read_csv(self._index_path, dtype=str, keep_default_na=False).drop_duplicates('pdf_url', keep="last")
+            for entry in index[index.sha256 != ""].to_dict("records"):  # empty hash: evicted
+                if os.path.exists(self._file(entry['sha256'])):
+                    entry['size'], entry['last_used'] = int(entry['size']), float(entry['last_used'])
+                    self._entries[entry['pdf_url']] = entry
+                    self._sizes[entry['sha256']] = entry['size']
+        # remove files that are not indexed, e.g. after an interrupted run
+        for folder, _, files in itertools.chain(os.walk(os.path.join(path, "files")), os.walk(os.path.join(path, "text"))):
+            for f in files:
+                if f.split(".")[0] not in self._sizes:
+                    os.remove(os.path.join(folder, f))
+        self._compact()
+        self._index = open(self._index_path, "a", newline="")
+        self._writer = csv.writer(self._index)
+        with self._lock:
+            self._evict()
+
+    def _file(self, sha256):
+        return os.path.join(self.path, "files", sha256[:2], f"{sha256}.pdf")
+
+    def _text_file(self, sha256):
+        return os.path.join(self.path, "text", sha256[:2], f"{sha256}.json.gz")
+
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), delete=False) as f:
+            f.write(content)
+        os.replace(f.name, path)
+
+    def _compact(self):
+        with tempfile.NamedTemporaryFile("w", dir=self.path, delete=False, newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            for entry in self._entries.values():
+                writer.writerow([entry[c] for c in self.columns])
+        os.replace(f.name, self._index_path)
+
+    def _append(self, entry):
+        self._writer.writerow([entry[c] for c in self.columns])
+        self._index.flush()
+
+    def _evict(self):
+        """Removes the least recently used files until the cache fits its size limit. Must be called with the lock held."""
+        if sum(self._sizes.values()) <= self.max_size:
+            return
+        last_used = {}
+        for entry in self._entries.values():
+            last_used[entry['sha256']] = max(last_used.get(entry['sha256'], 0), entry['last_used'])
+        size = sum(self._sizes.values())
+        evicted = set()
+        for sha256 in sorted(last_used, key=last_used.get):
+            if size <= self.max_size:
+                break
+            size -= self._sizes.pop(sha256)
+            evicted.add(sha256)
+            for path in [self._file(sha256), self._text_file(sha256)]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        for url in [url for url, entry in self._entries.items() if entry['sha256'] in evicted]:
+            del self._entries[url]
+            self._append({'pdf_url': url, 'sha256': "", 'size': "", 'etag': "", 'last_modified': "", 'last_used': ""})
+
+    def lookup(self, url):
+        """Looks up the cached PDF of a URL and marks it as used.
+
+        Args:
+            url (str): URL of the PDF
+
+        Returns:
+            dict: 'sha256' hash of the PDF, 'etag' and 'last_modified' validators (empty if the server sent none), None if the PDF is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            entry['last_used'] = time.time()
+            self._append(entry)
+            return {k: entry[k] for k in ['sha256', 'etag', 'last_modified']}
+
+    def read(self, sha256):
+        """Reads a cached PDF.
+
+        Args:
+            sha256 (str): hash of the PDF
+
+        Returns:
+            bytes: content of the PDF, None if it is not cached (anymore)
+        """
+        try:
+            with open(self._file(sha256), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def read_text(self, sha256):
+        """Reads the stored text of a cached PDF.
+
+        Args:
+            sha256 (str): hash of the PDF
+
+        Returns:
+            list<str>: text of each page, None if it is not stored
+        """
+        try:
+            with gzip.open(self._text_file(sha256), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, content, etag=None, last_modified=None):
+        """Caches a downloaded PDF.
+
+        Args:
+            url (str): URL of the PDF
+            content (bytes): content of the PDF
+            etag (str, optional): ETag sent by the server. Defaults to None.
+            last_modified (str, optional): Last-Modified date sent by the server. Defaults to None.
+
+        Returns:
+            str: hash of the PDF
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        if not os.path.exists(self._file(sha256)):
+            self._write(self._file(sha256), content)
+        entry = {'pdf_url': url, 'sha256': sha256, 'size': len(content), 'etag': etag or "", 'last_modified': last_modified or "", 'last_used': time.time()}
+        with self._lock:
+            self._entries[url] = entry
+            self._sizes[sha256] = len(content)
+            self._append(entry)
+            self._evict()
+        return sha256
+
+    def put_text(self, sha256, pages):
+        """Stores the text of a cached PDF.
+
+        Args:
+            sha256 (str): hash of the PDF
+            pages (list<str>): text of each page
+        """
+        with self._lock:
+            if sha256 not in self._sizes:  # evicted in the meantime
+                return
+        self._write(self._text_file(sha256), gzip.compress(json.dumps(pages).encode("utf-8")))
+
+    def close(self):
+        """Compacts the index, closes it and unlocks the cache directory."""
+        with self._lock:
+            self._index.close()
+            self._compact()
+        self._lock_file.close()
+
+def get_session(workers):
+    """Creates an HTTP session that keeps connections alive between downloads, with enough connections for all download threads.
+
+    Args:
+        workers (int): number of download threads
+
+    Returns:
+        requests.Session: the session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(workers, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def download_pdf(url, session, host_limiter, verbose, cache=None):
+    """Downloads a file if it is a PDF of less than 50 MB. A cached PDF is only downloaded again if the server reports that it changed.
+
+    Args:
+        url (str): URL of the file
+        session (requests.Session): HTTP session to download with
+        host_limiter (HostLimiter): limits concurrent downloads per host
+        verbose (bool): toggles verbose output
+        cache (PDFCache, optional): cache of downloaded PDFs. Defaults to None.
+
+    Returns:
+        tuple: hash of the PDF in the cache (None without cache) and its content (None if the cached PDF did not change), both None if the file is not a PDF, too large or could not be downloaded
+    """
+    if type(url) != str:
+        return None, None
+    cached = cache.lookup(url) if cache is not None else None
+    headers = {}
+    if cached is not None:  # revalidate
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    sha256 = None
+    try:
+        with host_limiter(url), session.get(url, stream=True, headers=headers) as pdf:
+            if pdf.status_code == 304 and cached is not None:
+                if verbose:
+                    print(f"Using cached {url}")
+                return cached['sha256'], None
+            if pdf.status_code != 200 or "pdf" not in pdf.headers.get('content-type', ''):
+                return None, None
+            size = int(pdf.headers.get('content-length', 0))
+            if size >= MAX_PDF_SIZE:
+                if verbose:
+                    print(f"Ignoring {url} of size {size}")
+                return None, None
+            chunks, received = [], 0
+            for chunk in pdf.iter_content(chunk_size=1 << 20):  # size is not always announced
+                chunks.append(chunk)
+                received += len(chunk)
+                if received >= MAX_PDF_SIZE:
+                    if verbose:
+                        print(f"Ignoring {url} of size > {int(MAX_PDF_SIZE)}")
+                    return None, None
+            content = b"".join(chunks)
+            if cache is not None:
+                sha256 = cache.put(url, content, pdf.headers.get('etag'), pdf.headers.get('last-modified'))
+    except requests.RequestException as e:
+        if cached is not None:
+            if verbose:
+                print(f"Failed to download {url}: {e}, using cached file")
+            return cached['sha256'], None
+        if verbose:
+            print(f"Failed to download {url}: {e}")
+        return None, None
+    if verbose:
+        print(f"Downloaded {url} of size {received}")
+    return sha256, content
+
+def extract_text(content):
+    """Extracts the text of each page of a PDF. Text extracted before a parsing error is kept.
+
+    Args:
+        content (bytes): content of the PDF
+
+    Returns:
+        list<str>: text of each page, with the text of each text container on its own line
+    """
+    pages = []
+    try:
+        page_layouts = extract_pages(BytesIO(content))
+        for page_layout in page_layouts:
+            pages.append([])
+            for element in page_layout:
+                if isinstance(element, LTTextContainer):
+                    pages[-1].append(element.get_text())
+    except Exception:
+        pass
+    return ["\n".join(texts) for texts in pages]  # URLs do not contain whitespace, so they do not span containers
+
+def find_domain_urls(pages, domain):
+    """Finds URLs of the domain in the text of a PDF.
+
+    Args:
+        pages (list<str>): text of each page
         domain (str): domain to scan for, e.g. github.com
 
     Returns:
-        pd.Series: added columns ['page_no', 'domain_url']
+        dict: lists of matches with keys ['page_no', 'domain_url']
     """
     pattern = rf"(?P<url>https?://(www\.)?{re.escape(domain)}[^\s]+)"
     matches = {k: [] for k in ['page_no', 'domain_url']}
-    pdf = requests.get(row['pdf_url'], stream=True)
-    if pdf.status_code == 200 and "pdf" in pdf.headers['content-type'] and int(pdf.headers['content-length']) < 5e7:  # ignore files larger than 50 MB to avoid OOM error
-        if verbose:
-            print(f"Parsing {row['pdf_url']} of size {int(pdf.headers['content-length'])}")
-        try:
-            page_layouts = extract_pages(BytesIO(pdf.content))
-            for page_no, page_layout in enumerate(page_layouts):
-                for element in page_layout:
-                    if isinstance(element, LTTextContainer):
-                        text = element.get_text()
-                        for match in re.finditer(pattern, text):
-                            matches['page_no'].append(page_no)
-                            matches['domain_url'].append(match.group("url"))
-        except Exception:
-            pass
-    elif pdf.status_code == 200 and "pdf" in pdf.headers['content-type']:
-        if verbose:
-            print(f"Ignoring {row['pdf_url']} of size {int(pdf.headers['content-length'])}")
+    for page_no, text in enumerate(pages):
+        for match in re.finditer(pattern, text):
+            matches['page_no'].append(page_no)
+            matches['domain_url'].append(match.group("url"))
+    return matches
+
+def get_domain_urls(df, domain, verbose, workers=1, parsers=1, per_host=2, cache=None, offline=False, memory_limit=None):
+    """Downloads the PDFs of the publications and finds URLs of the domain in them.
+    Downloads run in a pool of threads sharing one HTTP session, at most per_host at once from each host. Downloaded PDFs are handed to a pool of parsing processes through a bounded queue, so that downloading pauses while parsing falls behind. PDFs whose text is stored in the cache are not parsed again, only scanned.
+
+    Args:
+        df (pd.DataFrame): contains column for PDF url
+        domain (str): domain to scan for, e.g. github.com
+        verbose (bool): toggles verbose output
+        workers (int, optional): number of PDFs to download concurrently. Defaults to 1.
+        parsers (int, optional): number of processes parsing PDFs. Defaults to 1.
+        per_host (int, optional): maximum number of concurrent downloads from one host. Defaults to 2.
+        cache (PDFCache, optional): cache of downloaded PDFs. Defaults to None.
+        offline (bool, optional): only scan cached PDFs, without downloading anything. Defaults to False.
+        memory_limit (int, optional): maximum address space of each parsing process in bytes. Defaults to None, i.e. no limit.
+
+    Returns:
+        pd.DataFrame: added columns ['page_no', 'domain_url']
+
+    Raises:
+        ValueError: if offline is set without a cache to scan
+    """
+    if offline and cache is None:
+        raise ValueError("Offline mode needs a cache of PDFs to scan.")
+    session = get_session(workers)
+    host_limiter = HostLimiter(per_host)
+    queue = threading.BoundedSemaphore(2 * parsers)  # places for PDFs waiting for or being parsed
+    matches = {k: [] for k in ['page_no', 'domain_url']}
+    with ThreadPoolExecutor(max_workers=workers) as downloads, \
+            ProcessPoolExecutor(max_workers=parsers, initializer=limit_memory, initargs=(memory_limit,)) as parsing:
+        def download(url):
+            # returns the stored text of the PDF or a future of its parsed text, and its hash in the cache
+            if offline:
+                cached = cache.lookup(url) if type(url) == str else None
+                sha256, content = (cached['sha256'] if cached is not None else None), None
+            else:
+                sha256, content = download_pdf(url, session, host_limiter, verbose, cache)
+            pages = cache.read_text(sha256) if sha256 is not None else None
+            if pages is not None:
+                return pages, None, sha256
+            if content is None and sha256 is not None:
+                content = cache.read(sha256)
+                if content is None and not offline:  # evicted in the meantime, no longer revalidated
+                    sha256, content = download_pdf(url, session, host_limiter, verbose, cache)
+            if content is None:
+                return [], None, None
+            queue.acquire()
+            future = parsing.submit(extract_text, content)
+            future.add_done_callback(lambda _: queue.release())
+            return None, future, sha256
+        # only a few downloads per worker are run ahead, so that results are collected in input order
+        urls = iter(df['pdf_url'])
+        window = 4 * max(workers, 1)
+        pending = deque(downloads.submit(download, url) for url in itertools.islice(urls, window))
+        while len(pending) > 0:
+            pages, parsed, sha256 = pending.popleft().result()
+            for url in itertools.islice(urls, 1):
+                pending.append(downloads.submit(download, url))
+            if parsed is not None:
+                pages = parsed.result()
+                if sha256 is not None:
+                    cache.put_text(sha256, pages)
+            for k, v in find_domain_urls(pages, domain).items():
+                matches[k].append(v)
+    df = df.copy()
     for k, v in matches.items():
-        row[k] = v
-    return row
+        df[k] = pd.Series(v, index=df.index, dtype=object)
+    return df
 
-def main(repo, date, domain, datadir, verbose):
+def main(repo, date, domain, datadir, verbose, workers=1, parsers=1, per_host=2, cache_dir=None, cache_size=None, offline=False, memory_limit=None):
+    limit_memory(memory_limit)  # also covers downloading, which runs in this process
     path = os.path.join(datadir, f"publication_urls/extracted_pdf_urls_{repo}_{date}.csv")
     df = pd.read_csv(path)
     # download file and search for URLs that contain the domain
-    d = df.apply(get_domain_urls, axis=1, args=(domain, verbose))
+    cache = PDFCache(cache_dir, cache_size) if cache_dir is not None else None
+    try:
+        d = get_domain_urls(df, domain, verbose, workers, parsers, per_host, cache, offline, memory_limit)
+    finally:
+        if cache is not None:
+            cache.close()
     print(d.head())
     if verbose:
         print(f"Extracted URLs of domain {domain} from respository {repo}.")
@@ -59,8 +445,6 @@ def main(repo, date, domain, datadir, verbose):
         print(f"Saved extracted URLs in {links_path}.csv")
 
 if __name__ == "__main__":
-    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
-    resource.setrlimit(resource.RLIMIT_AS, (2000000000, hard))
     parser = argparse.ArgumentParser(
         prog="parse_pdfs",
         description="Scan the downloadable publications for links of a specific domain name, e.g. github.com."
@@ -69,6 +453,15 @@ if __name__ == "__main__":
     parser.add_argument("--date", required=True, type=str, help="date range for filtering ePrints, e.g. 2021-2022")
     parser.add_argument("--domain", required=True, type=str, help="domain to match against (only one can be provided for now, e.g. github.com)")
     parser.add_argument("--datadir", default="../../data/raw/eprints/", help="directory to write ePrints data to")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of PDFs to download concurrently")
+    parser.add_argument("--parsers", default=1, type=int, help="number of processes parsing PDFs")
+    parser.add_argument("--per-host", default=2, type=int, help="maximum number of concurrent downloads from one host")
+    parser.add_argument("--cache-dir", default=None, type=str, help="directory to cache downloaded PDFs and their text in, e.g. outside the repository; PDFs are not cached if not given")
+    parser.add_argument("--cache-size", default=20, type=float, help="maximum disk space used by the PDF cache in GB (default 20), least recently used PDFs are evicted")
+    parser.add_argument("--offline", action="store_true", help="only scan PDFs from the cache given by --cache-dir, without downloading anything")
+    parser.add_argument("--memory-limit", default=2000000000, type=int, help="maximum address space in bytes of the main process and of each parsing process")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.repo, args.date, args.domain, args.datadir, args.verbose)
\ No newline at end of file
+    if args.offline and args.cache_dir is None:
+        parser.error("--offline needs a cache, given by --cache-dir")
+    main(args.repo, args.date, args.domain, args.datadir, args.verbose, args.workers, args.parsers, args.per_host, args.cache_dir, int(args.cache_size * 1e9), args.offline, args.memory_limit)
@@ -1,21 +1,25 @@
 import argparse
+import functools
 import pandas as pd
 import os
 import time
-import resource
+from concurrent.futures import ProcessPoolExecutor
 from github import Github
 from github.GithubException import RateLimitExceededException, UnknownObjectException
 from emoji import emoji_count
-from pydriller import Repository
-from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_token
+from datetime import datetime
+from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_tokens, ClientPool, throttle, GraphQLClient, GRAPHQL_URL, query_repos_graphql, local_clone, fetch_blobs, run_git, limit_memory, read_dataset
+
+README_DIRECTORIES = [".github", "", "docs"]  # in the order Github looks for a README
 
 @wrap_query
-def query_readme_history(row: pd.Series, id_key: str, *args, **kwargs):
+def query_readme_history(row: pd.Series, id_key: str, *args, cache_dir: str, **kwargs):
     """Goes through commit history of README file.
 
     Args:
         row (pd.Series): contains column with repository ID and path to its README file
         id_key (str): name of column containing repository ID
+        cache_dir (str): directory containing local clones of the repositories, None to clone each repository into a temporary directory
 
     Returns:
         pd.Series: added columns ['author_date', 'added_headings', 'deleted_headings', 'added_cites']
@@ -24,46 +28,105 @@ def query_readme_history(row: pd.Series, id_key: str, *args, **kwargs):
     readme_path = row['readme_path']
     if pd.isna(readme_path) or not readme_path.endswith('md'):
         return None
-    repo_readme = Repository('https://github.com/'+repo_link, filepath=readme_path)
+    with local_clone(repo_link, cache_dir) as repo_path:
+        fetch_blobs(repo_path, [readme_path])
+        commits = file_history(repo_path, readme_path, patch=True)
     history = {k: [] for k in ['author_date', 'added_headings', 'deleted_headings', 'added_cites']}
-    for commit in repo_readme.traverse_commits():
-        try:
-            added_headings = []
-            deleted_headings = []
-            added_cites = []
-            # look for changes to readme file in commit
-            for f in commit.modified_files:
-                if f.new_path == readme_path:
-                    for _, line in f.diff_parsed['added']:
-                        if line.startswith('#'):
-                            added_headings.append(line.lstrip('# '))
-                        else:
-                            for indicator in ["DOI:", "doi.", "@article", "@misc"]:
-                                if indicator in line :
-                                    added_cites.append(line)
-                    for _, line in f.diff_parsed['deleted']:
-                        if line.startswith('#'):
-                            deleted_headings.append(line.lstrip('# '))
-                    break
-            if len(added_headings) > 0 or len(deleted_headings) > 0 or len(added_cites) > 0:
-                history['author_date'].append(commit.author_date)
-                history['added_headings'].append(added_headings)
-                history['deleted_headings'].append(deleted_headings)
-                history['added_cites'].append(added_cites)
-        except ValueError:  # can be raised by git on missing commits somehow
-            pass
+    for author_date, diff in commits:
+        added_headings = []
+        deleted_headings = []
+        added_cites = []
+        added_lines, deleted_lines = parse_diff(diff)
+        for line in added_lines:
+            if line.startswith('#'):
+                added_headings.append(line.lstrip('# '))
+            else:
+                for indicator in ["DOI:", "doi.", "@article", "@misc"]:
+                    if indicator in line :
+                        added_cites.append(line)
+        for line in deleted_lines:
+            if line.startswith('#'):
+                deleted_headings.append(line.lstrip('# '))
+        if len(added_headings) > 0 or len(deleted_headings) > 0 or len(added_cites) > 0:
+            history['author_date'].append(author_date)
+            history['added_headings'].append(added_headings)
+            history['deleted_headings'].append(deleted_headings)
+            history['added_cites'].append(added_cites)
     for k, v in history.items():
         row[k] = v
     return row
 
+def file_history(repo_path, filepath, patch=False):
+    """Lists the commits that modified a file, oldest first. Renames of the file are followed.
+
+    Args:
+        repo_path (str): path to a local clone of the repository
+        filepath (str): path of the file within the repository
+        patch (bool, optional): include the changes made to the file. Defaults to False.
+
+    Returns:
+        list<tuple>: author date (datetime.datetime) and, if patch is set, diff (str) of each commit; empty if the file is not present in the latest commit
+    """
+    if run_git(repo_path, "ls-tree", "--name-only", "HEAD", "--", filepath, check=False).strip() == b"":
+        return []
+    args = ["log", "--follow", "--format=%x00%aI"]
+    if patch:
+        args.append("--patch")
+    output = run_git(repo_path, "-c", "core.quotePath=false", *args, "--", filepath).decode("utf-8", "ignore")
+    history = []
+    for entry in output.split("\0")[1:]:
+        author_date, _, diff = entry.partition("\n")
+        if patch:
+            # only count changes to the file under its current name
+            diff = diff[diff.find("\n@@") + 1:] if f"\n+++ b/{filepath}\n" in diff else ""
+            history.append((datetime.fromisoformat(author_date), diff))
+        else:
+            history.append((datetime.fromisoformat(author_date),))
+    history.reverse()
+    return history
+
+def parse_diff(diff):
+    """Extracts the added and deleted lines from the hunks of a diff.
+
+    Args:
+        diff (str): diff of a single file, starting with its first hunk
+
+    Returns:
+        tuple<list<str>>: added lines and deleted lines
+    """
+    added, deleted = [], []
+    for line in diff.split("\n"):
+        line = line.rstrip()
+        if line.startswith("+"):
+            added.append(line[1:])
+        elif line.startswith("-"):
+            deleted.append(line[1:])
+    return added, deleted
+
+def query_file_added(repo_path, filepath):
+    """Finds the date a file was first committed to a repository.
+
+    Args:
+        repo_path (str): path to a local clone of the repository
+        filepath (str): path of the file within the repository
+
+    Returns:
+        datetime.datetime: author date of the first commit touching the file, None if there is none
+    """
+    history = file_history(repo_path, filepath)
+    if len(history) == 0:
+        return None
+    return history[0][0]
+
 @wrap_query
-def query_contents(row: pd.Series, id_key: str, g: Github):
+def query_contents(row: pd.Series, id_key: str, g: Github, cache_dir: str):
     """Gets metadata about interesting files in a repository.
 
     Args:
         row (pd.Series): contains column with repository ID
         id_key (str): name of column containing repository ID
         g (Github): authenticated access to Github API
+        cache_dir (str): directory containing local clones of the repositories, None to clone each repository into a temporary directory
 
     Returns:
         pd.Series: added columns ['license', 'readme_size', 'readme_path', 'readme_emojis', 'contributing_size', 'citation_added', 'contributing_added']
@@ -75,11 +138,13 @@ def query_contents(row: pd.Series, id_key: str, g: Github):
     for tries in range(2):  # allow retry
         try:
             try:  # LICENSE
+                throttle(g)
                 license_file = repo.get_license()
                 contents['license'].append(license_file.license.key)
             except UnknownObjectException:
                 contents['license'].append(None)
             try:  # README.md
+                throttle(g)
                 readme = repo.get_readme()
                 contents['readme_size'].append(readme.size)
                 readme_content = readme.decoded_content.decode()
@@ -90,6 +155,7 @@ def query_contents(row: pd.Series, id_key: str, g: Github):
                 contents['readme_emojis'].append(0)
                 contents['readme_path'].append(None)
             try:  # CONTRIBUTING
+                throttle(g)
                 contents['contributing_size'].append(repo.get_contents("CONTRIBUTING.md").size)
             except UnknownObjectException:
                 contents['contributing_size'].append(0)
@@ -99,23 +165,69 @@ def query_contents(row: pd.Series, id_key: str, g: Github):
             else:
                 raise
         break  # break early if no rate limit problem
-    repo_citation = Repository('https://github.com/'+row[id_key], filepath="CITATION.cff")
-    commits_iterator = repo_citation.traverse_commits()
-    try:
-        contents['citation_added'].append(next(commits_iterator).author_date)
-    except StopIteration:
-        contents['citation_added'].append(None)
-    repo_contrib_guidelines = Repository('https://github.com/'+row[id_key], filepath="CONTRIBUTING.md")
-    contrib_guidelines_iterator = repo_contrib_guidelines.traverse_commits()
-    try:
-        contents['contributing_added'].append(next(contrib_guidelines_iterator).author_date)
-    except StopIteration:
-        contents['contributing_added'].append(None)
+    with local_clone(row[id_key], cache_dir) as repo_path:
+        contents['citation_added'].append(query_file_added(repo_path, "CITATION.cff"))
+        contents['contributing_added'].append(query_file_added(repo_path, "CONTRIBUTING.md"))
     for k, v in contents.items():
         row[k] = v
     return row
 
-def crawl_repos(df, name, target_folder, verbose):
+def find_readme(result):
+    """Picks the README file from the directory listings of a repository, mimicking Github's preference.
+
+    Args:
+        result (dict): GraphQL data for the repository with a tree listing "dir{i}" for each entry of README_DIRECTORIES
+
+    Returns:
+        str: path of the README file, None if there is none
+    """
+    for i, directory in enumerate(README_DIRECTORIES):
+        tree = result.get(f"dir{i}") or {}
+        names = [e["name"] for e in tree.get("entries", []) if e["type"] == "blob" and e["name"].lower().startswith("readme")]
+        if len(names) > 0:
+            name = sorted(names, key=lambda n: (not n.lower().endswith(".md"), len(n)))[0]
+            return f"{directory}/{name}" if directory else name
+    return None
+
+@wrap_query
+def query_contents_batch(repos: pd.DataFrame, id_key: str, client: GraphQLClient, cache_dir: str):
+    """Gets metadata about interesting files in several repositories. Instead of four REST calls per repository, this takes two GraphQL queries per batch: one for the license, contributing guidelines and the directories a README may be in, and one for the README files themselves.
+
+    Args:
+        repos (pd.DataFrame): contains column with repository IDs
+        id_key (str): name of column containing repository ID
+        client (GraphQLClient): access to Github's GraphQL API
+        cache_dir (str): directory containing local clones of the repositories, None to clone each repository into a temporary directory
+
+    Returns:
+        pd.DataFrame: added columns ['license', 'readme_size', 'readme_path', 'readme_emojis', 'contributing_size', 'citation_added', 'contributing_added'] for each repository that could be resolved
+    """
+    repo_links = list(repos[id_key])
+    directories = " ".join(f'dir{i}: object(expression: "HEAD:{d}") {{ ... on Tree {{ entries {{ name type }} }} }}' for i, d in enumerate(README_DIRECTORIES))
+    fields = f'licenseInfo {{ key }} contributing: object(expression: "HEAD:CONTRIBUTING.md") {{ ... on Blob {{ byteSize }} }} {directories}'
+    results = query_repos_graphql(client, repo_links, fields)
+    readme_paths = [find_readme(r) if r is not None else None for r in results]
+    readme_fields = [f'readme: object(expression: "HEAD:{p}") {{ ... on Blob {{ byteSize text }} }}' if p is not None else "id" for p in readme_paths]
+    readmes = query_repos_graphql(client, repo_links, readme_fields)
+    rows = []
+    for (_, row), result, readme_path, readme in zip(repos.iterrows(), results, readme_paths, readmes):
+        if result is None:
+            continue
+        readme_blob = (readme or {}).get("readme")
+        row['license'] = [result['licenseInfo']['key'] if result['licenseInfo'] is not None else None]
+        row['readme_size'] = [readme_blob['byteSize'] if readme_blob is not None else 0]
+        row['readme_path'] = [readme_path if readme_blob is not None else None]
+        row['readme_emojis'] = [emoji_count(readme_blob['text'] or "") if readme_blob is not None else 0]
+        row['contributing_size'] = [result['contributing']['byteSize'] if result['contributing'] is not None else 0]
+        with local_clone(row[id_key], cache_dir) as repo_path:
+            row['citation_added'] = [query_file_added(repo_path, "CITATION.cff")]
+            row['contributing_added'] = [query_file_added(repo_path, "CONTRIBUTING.md")]
+        rows.append(row)
+    if len(rows) == 0:
+        return None
+    return pd.DataFrame(rows)
+
+def crawl_repos(df, name, target_folder, verbose, workers=1, graphql_url=None, batch_size=50, clone_cache=None, processes=1, memory_limit=None, file_format="csv"):
     """For each repository, retrieve contents and readme info.
 
     Args:
@@ -123,38 +235,53 @@ def crawl_repos(df, name, target_folder, verbose):
         name (str): name of column containing the identifiers
         target_folder (str): path to folder to store CSV data in
         verbose (bool): toggles verbose output
+        workers (int, optional): number of repositories (or batches) to query concurrently. Defaults to 1.
+        graphql_url (str, optional): if given, query file metadata for batches of repositories from this GraphQL endpoint instead of using the REST API. Defaults to None.
+        batch_size (int, optional): number of repositories per GraphQL query. Defaults to 50.
+        clone_cache (str, optional): directory to keep local clones of the repositories in, so that later runs only need to fetch new commits. Defaults to None, i.e. each repository is cloned into a temporary directory, removed as soon as it has been queried.
+        processes (int, optional): number of processes mining readme histories in parallel. Defaults to 1.
+        memory_limit (int, optional): maximum address space of each of these processes in bytes. Defaults to None, i.e. no limit.
+        file_format (str, optional): format of the output files, "csv" or "parquet". Defaults to "csv".
     """
     repo_links = df[[name]]
     repo_links = repo_links.drop_duplicates()
-    g = Github(get_access_token())
+    pool = ClientPool(get_access_tokens())
     if verbose:
-        print(g.rate_limiting)
+        print(pool.rate_limiting)
         print("Querying contents...")
         start = time.time()
-    collect(g, repo_links, name, query_contents,
-            [],
-            os.path.join(target_folder, 'contents.csv'))
+    if graphql_url is not None:
+        collect(GraphQLClient(get_access_tokens(), graphql_url), repo_links, name, functools.partial(query_contents_batch, cache_dir=clone_cache),
+                [],
+                os.path.join(target_folder, f'contents.{file_format}'),
+                workers, batch_size)
+    else:
+        collect(pool, repo_links, name, functools.partial(query_contents, cache_dir=clone_cache),
+                [],
+                os.path.join(target_folder, f'contents.{file_format}'),
+                workers)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
         print("Querying readme history...")
         start = time.time()
-    contents_df = pd.read_csv(os.path.join(target_folder, 'contents.csv'))
-    collect(g, contents_df[[name, 'readme_path']], name, query_readme_history,
-            [],
-            os.path.join(target_folder, 'readme_history.csv'))
+    contents_df = read_dataset(os.path.join(target_folder, f'contents.{file_format}')).reset_index(drop=True)
+    with ProcessPoolExecutor(max_workers=processes, initializer=limit_memory, initargs=(memory_limit,)) as executor:
+        collect(pool, contents_df[[name, 'readme_path']], name, functools.partial(query_readme_history, cache_dir=clone_cache),
+                [],
+                os.path.join(target_folder, f'readme_history.{file_format}'),
+                processes, executor=executor)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
 
-def main(path, name, datadir, verbose):
+def main(path, name, datadir, verbose, workers, graphql_url, batch_size, clone_cache, processes, memory_limit, file_format):
+    limit_memory(memory_limit)  # also covers the contents phase, which runs in this process
     df = pd.read_csv(path)
     target_folder = datadir
-    crawl_repos(df, name, target_folder, verbose)
+    crawl_repos(df, name, target_folder, verbose, workers, graphql_url, batch_size, clone_cache, processes, memory_limit, file_format)
 
 if __name__ == "__main__":
-    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
-    resource.setrlimit(resource.RLIMIT_AS, (2000000000, hard))
     parser = argparse.ArgumentParser(
         prog="crawl",
         description="Given a dataframe with a column indicating the GitHub repository ID, gather data from the corresponding GitHub repository."
@@ -162,6 +289,14 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", required=True, type=str, help="CSV file")
     parser.add_argument("-n", "--name", required=True, type=str, help="name of column containing github ID")
     parser.add_argument("--datadir", default="../../data/raw/eprints/", help="directory to write ePrints data to")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of repositories to query concurrently")
+    parser.add_argument("--graphql", action="store_true", help="query file metadata for batches of repositories through the GraphQL API")
+    parser.add_argument("--graphql-url", default=GRAPHQL_URL, type=str, help="GraphQL endpoint to use with --graphql")
+    parser.add_argument("--batch-size", default=50, type=int, help="number of repositories per GraphQL query")
+    parser.add_argument("--clone-cache", default=None, type=str, help="directory to keep local clones of the repositories in between runs (default: temporary directory)")
+    parser.add_argument("-p", "--processes", default=1, type=int, help="number of processes mining readme histories in parallel")
+    parser.add_argument("--memory-limit", default=2000000000, type=int, help="maximum address space in bytes of the crawl and of each readme history process")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the output files")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.file, args.name, args.datadir, args.verbose)
+    main(args.file, args.name, args.datadir, args.verbose, args.workers, args.graphql_url if args.graphql else None, args.batch_size, args.clone_cache, args.processes, args.memory_limit, args.format)
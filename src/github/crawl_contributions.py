@@ -4,7 +4,7 @@ import os
 import time
 from github import Github
 from github.GithubException import RateLimitExceededException
-from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_token
+from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_tokens, ClientPool, throttle
 
 @wrap_query
 def query_contributions(row: pd.Series, id_key: str, g: Github):
@@ -24,11 +24,13 @@ def query_contributions(row: pd.Series, id_key: str, g: Github):
         return None
     for tries in range(2):
         try:
+            throttle(g)
             contribution_stats = repo.get_stats_contributors()
             if contribution_stats is not None:
                 for inner_tries in range(2):
                     try:
                         for s in contribution_stats:
+                            throttle(g)
                             for w in s.weeks:
                                 contributions['author'].append(s.author.login)
                                 contributions['week_co'].append(w.w)
@@ -49,7 +51,7 @@ def query_contributions(row: pd.Series, id_key: str, g: Github):
         row[k] = v
     return row
 
-def crawl_repos(df, name, target_folder, verbose):
+def crawl_repos(df, name, target_folder, verbose, workers=1, file_format="csv"):
     """For each repository, retrieve contributions and store as CSV.
 
     Args:
@@ -57,25 +59,28 @@ def crawl_repos(df, name, target_folder, verbose):
         name (str): name of column containing the identifiers
         target_folder (str): path to folder to store CSV data in
         verbose (bool): toggles verbose output
+        workers (int, optional): number of repositories to query concurrently. Defaults to 1.
+        file_format (str, optional): format of the output files, "csv" or "parquet". Defaults to "csv".
     """
     repo_links = df[[name]]
     repo_links = repo_links.drop_duplicates()
-    g = Github(get_access_token())
+    pool = ClientPool(get_access_tokens())
     if verbose:
-        print(g.rate_limiting)
+        print(pool.rate_limiting)
         print("Querying contributions...")
         start = time.time()
-    collect(g, repo_links, name, query_contributions,
+    collect(pool, repo_links, name, query_contributions,
             ['author', 'week_co', 'commits'],
-            os.path.join(target_folder, 'contributions.csv'))
+            os.path.join(target_folder, f'contributions.{file_format}'),
+            workers)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
 
-def main(path, name, datadir, verbose):
+def main(path, name, datadir, verbose, workers, file_format):
     df = pd.read_csv(path)
     target_folder = datadir
-    crawl_repos(df, name, target_folder, verbose)
+    crawl_repos(df, name, target_folder, verbose, workers, file_format)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -85,6 +90,8 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", required=True, type=str, help="CSV file")
     parser.add_argument("-n", "--name", required=True, type=str, help="name of column containing github ID")
     parser.add_argument("--datadir", default="../../data/raw/eprints/", help="directory to write ePrints data to")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of repositories to query concurrently")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the output files")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.file, args.name, args.datadir, args.verbose)
\ No newline at end of file
+    main(args.file, args.name, args.datadir, args.verbose, args.workers, args.format)
\ No newline at end of file
@@ -4,17 +4,18 @@ import os
 import time
 from github import Github
 from github.GithubException import RateLimitExceededException
-from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_token
+from utils import wrap_query, catch_rate_limit, collect, collect_incremental, safe_load_repo, get_access_tokens, ClientPool, throttle
 
 
 @wrap_query
-def query_stars(row: pd.Series, id_key: str, g: Github):
+def query_stars(row: pd.Series, id_key: str, g: Github, since: dict = None):
     """Gets stargazers of a repository.
 
     Args:
         row (pd.Series): contains column with repository ID
         id_key (str): name of column containing repository ID
         g (Github): authenticated access to Github API
+        since (dict, optional): maps repository IDs to the date of the latest star already crawled; only stars from then on are fetched, newest first. Defaults to None.
 
     Returns:
         pd.Series: added columns ['date', 'user']
@@ -23,10 +24,16 @@ def query_stars(row: pd.Series, id_key: str, g: Github):
     repo = safe_load_repo(g, row[id_key], "query_stars")
     if repo is None:
         return None
+    since = (since or {}).get(row[id_key])
     for tries in range(2):
         try:
             stargazers = repo.get_stargazers_with_dates()
+            if since is not None:
+                stargazers = stargazers.reversed
             for sg in stargazers:
+                throttle(g)
+                if since is not None and sg.starred_at < since:
+                    break
                 for inner_tries in range(2):
                     try:
                         stars['date'].append(sg.starred_at)
@@ -44,17 +51,18 @@ def query_stars(row: pd.Series, id_key: str, g: Github):
                 raise
         break
     for k, v in stars.items():
-        row[k] = v
+        row[k] = v[::-1] if since is not None else v  # keep chronological order
     return row
 
 @wrap_query
-def query_forks(row: pd.Series, id_key: str, g: Github):
+def query_forks(row: pd.Series, id_key: str, g: Github, since: dict = None):
     """Gets forks a repository.
 
     Args:
         row (pd.Series): contains column with repository ID
         id_key (str): name of column containing repository ID
         g (Github): authenticated access to Github API
+        since (dict, optional): maps repository IDs to the date of the latest fork already crawled; only forks from then on are fetched. Defaults to None.
 
     Returns:
         pd.Series: added columns ['date', 'user']
@@ -63,10 +71,14 @@ def query_forks(row: pd.Series, id_key: str, g: Github):
     repo = safe_load_repo(g, row[id_key], "query_forks")
     if repo is None:
         return None
+    since = (since or {}).get(row[id_key])
     for tries in range(2):
         try:
-            forks_list = repo.get_forks()
+            forks_list = repo.get_forks()  # newest first
             for f in forks_list:
+                throttle(g)
+                if since is not None and f.created_at < since:
+                    break
                 for inner_tries in range(2):
                     try:
                         forks['date'].append(f.created_at)
@@ -87,7 +99,7 @@ def query_forks(row: pd.Series, id_key: str, g: Github):
         row[k] = v
     return row
 
-def crawl_repos(df, name, target_folder, verbose):
+def crawl_repos(df, name, target_folder, verbose, workers=1, incremental=False, file_format="csv"):
     """For each repository, retrieve stars and forks. Stored as separate CSV.
 
     Args:
@@ -95,33 +107,52 @@ def crawl_repos(df, name, target_folder, verbose):
         name (str): name of column containing the identifiers
         target_folder (str): path to folder to store CSV data in
         verbose (bool): toggles verbose output
+        workers (int, optional): number of repositories to query concurrently. Defaults to 1.
+        incremental (bool, optional): only fetch events newer than those in existing CSV files and merge them in. Defaults to False.
+        file_format (str, optional): format of the output files, "csv" or "parquet". Defaults to "csv".
     """
     repo_links = df[[name]]
     repo_links = repo_links.drop_duplicates()
-    g = Github(get_access_token())
+    pool = ClientPool(get_access_tokens())
     if verbose:
-        print(g.rate_limiting)
+        print(pool.rate_limiting)
         print("Querying stargazers...")
         start = time.time()
-    collect(g, repo_links, name, query_stars, 
-            [],
-            os.path.join(target_folder, 'stars.csv'))
+    if incremental:
+        collect_incremental(pool, repo_links, name, query_stars,
+                            [],
+                            os.path.join(target_folder, f'stars.{file_format}'),
+                            ['date'], ['date', 'user'],
+                            workers)
+    else:
+        collect(pool, repo_links, name, query_stars, 
+                [],
+                os.path.join(target_folder, f'stars.{file_format}'),
+                workers)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
         print("Querying forks...")
         start = time.time()
-    collect(g, repo_links, name, query_forks, 
-        [],
-        os.path.join(target_folder, 'forks.csv'))
+    if incremental:
+        collect_incremental(pool, repo_links, name, query_forks,
+                            [],
+                            os.path.join(target_folder, f'forks.{file_format}'),
+                            ['date'], ['date', 'user'],
+                            workers)
+    else:
+        collect(pool, repo_links, name, query_forks, 
+            [],
+            os.path.join(target_folder, f'forks.{file_format}'),
+            workers)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
 
-def main(path, name, datadir, verbose):
+def main(path, name, datadir, verbose, workers, incremental, file_format):
     df = pd.read_csv(path)
     target_folder = datadir
-    crawl_repos(df, name, target_folder, verbose)
+    crawl_repos(df, name, target_folder, verbose, workers, incremental, file_format)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -131,6 +162,9 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", required=True, type=str, help="CSV file")
     parser.add_argument("-n", "--name", required=True, type=str, help="name of column containing github ID")
     parser.add_argument("--datadir", default="../../data/raw/eprints/", help="directory to write ePrints data to")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of repositories to query concurrently")
+    parser.add_argument("--incremental", action="store_true", help="only fetch events newer than those already in the output files and merge them in")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the output files")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.file, args.name, args.datadir, args.verbose)
\ No newline at end of file
+    main(args.file, args.name, args.datadir, args.verbose, args.workers, args.incremental, args.format)
\ No newline at end of file
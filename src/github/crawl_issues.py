@@ -4,16 +4,17 @@ import os
 import time
 from github import Github
 from github.GithubException import RateLimitExceededException
-from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_token
+from utils import wrap_query, catch_rate_limit, collect, collect_incremental, safe_load_repo, get_access_tokens, ClientPool, throttle
 
 @wrap_query
-def query_issues(row: pd.Series, id_key: str, g: Github):
+def query_issues(row: pd.Series, id_key: str, g: Github, since: dict = None):
     """Gets all available issues in a repository.
 
     Args:
         row (pd.Series): contains column with repository ID
         id_key (str): name of column containing repository ID
         g (Github): authenticated access to Github API
+        since (dict, optional): maps repository IDs to the date of the latest issue event already crawled; only issues updated from then on are fetched. Defaults to None.
 
     Returns:
         pd.Series: added columns ['state', 'created_at', 'user', 'closed_at', 'closed_by']
@@ -22,10 +23,15 @@ def query_issues(row: pd.Series, id_key: str, g: Github):
     repo = safe_load_repo(g, row[id_key], "query_issues")
     if repo is None:
         return None
+    since = (since or {}).get(row[id_key])
     for tries in range(2):
         try:
-            issues_paged = repo.get_issues(state='all')
+            if since is not None:
+                issues_paged = repo.get_issues(state='all', since=since)
+            else:
+                issues_paged = repo.get_issues(state='all')
             for i in issues_paged:
+                throttle(g)
                 for inner_tries in range(2):
                     try:
                         state = i.state
@@ -56,7 +62,7 @@ def query_issues(row: pd.Series, id_key: str, g: Github):
         row[k] = v
     return row
 
-def crawl_repos(df, name, target_folder, verbose):
+def crawl_repos(df, name, target_folder, verbose, workers=1, incremental=False, file_format="csv"):
     """For each repository, retrieve issues and store as CSV.
 
     Args:
@@ -64,25 +70,36 @@ def crawl_repos(df, name, target_folder, verbose):
         name (str): name of column containing the identifiers
         target_folder (str): path to folder to store CSV data in
         verbose (bool): toggles verbose output
+        workers (int, optional): number of repositories to query concurrently. Defaults to 1.
+        incremental (bool, optional): only fetch issues updated since the latest event in an existing CSV file and merge them in. Defaults to False.
+        file_format (str, optional): format of the output files, "csv" or "parquet". Defaults to "csv".
     """
     repo_links = df[[name]]
     repo_links = repo_links.drop_duplicates()
-    g = Github(get_access_token())
+    pool = ClientPool(get_access_tokens())
     if verbose:
-        print(g.rate_limiting)
+        print(pool.rate_limiting)
         print("Querying issues...")
         start = time.time()
-    collect(g, repo_links, name, query_issues,
-            ['state'],
-            os.path.join(target_folder, 'issues.csv'))
+    if incremental:
+        collect_incremental(pool, repo_links, name, query_issues,
+                            ['state'],
+                            os.path.join(target_folder, f'issues.{file_format}'),
+                            ['created_at', 'closed_at'], ['created_at', 'user'],
+                            workers)
+    else:
+        collect(pool, repo_links, name, query_issues,
+                ['state'],
+                os.path.join(target_folder, f'issues.{file_format}'),
+                workers)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
 
-def main(path, name, datadir, verbose):
+def main(path, name, datadir, verbose, workers, incremental, file_format):
     df = pd.read_csv(path)
     target_folder = datadir
-    crawl_repos(df, name, target_folder, verbose)
+    crawl_repos(df, name, target_folder, verbose, workers, incremental, file_format)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -92,6 +109,9 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", required=True, type=str, help="CSV file")
     parser.add_argument("-n", "--name", required=True, type=str, help="name of column containing github ID")
     parser.add_argument("--datadir", default="../../data/raw/eprints/", help="directory to write ePrints data to")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of repositories to query concurrently")
+    parser.add_argument("--incremental", action="store_true", help="only fetch events newer than those already in the output files and merge them in")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the output files")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.file, args.name, args.datadir, args.verbose)
+    main(args.file, args.name, args.datadir, args.verbose, args.workers, args.incremental, args.format)
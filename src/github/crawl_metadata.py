@@ -4,7 +4,7 @@ import os
 import time
 from github import Github
 from github.GithubException import RateLimitExceededException
-from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_token
+from utils import wrap_query, catch_rate_limit, collect, safe_load_repo, get_access_tokens, ClientPool, GraphQLClient, GRAPHQL_URL, query_repos_graphql, parse_graphql_datetime
 
 
 @wrap_query
@@ -39,7 +39,35 @@ def query_metadata(row: pd.Series, id_key: str, g: Github):
         row[k] = v
     return row
 
-def crawl_repos(df, name, target_folder, verbose):
+@wrap_query
+def query_metadata_batch(repos: pd.DataFrame, id_key: str, client: GraphQLClient):
+    """Gets archival status, creation date, wiki existance and page existance for several repositories with a single GraphQL query.
+    GraphQL does not expose whether a repository has pages, so this is derived from the presence of a "github-pages" deployment environment.
+
+    Args:
+        repos (pd.DataFrame): contains column with repository IDs
+        id_key (str): name of column containing repository ID
+        client (GraphQLClient): access to Github's GraphQL API
+
+    Returns:
+        pd.DataFrame: added columns ['archived', 'created_at', 'has_wiki', 'has_pages'] for each repository that could be resolved
+    """
+    fields = 'isArchived createdAt hasWikiEnabled pages: environment(name: "github-pages") { id }'
+    results = query_repos_graphql(client, list(repos[id_key]), fields)
+    rows = []
+    for (_, row), result in zip(repos.iterrows(), results):
+        if result is None:
+            continue
+        row['archived'] = [result['isArchived']]
+        row['created_at'] = [parse_graphql_datetime(result['createdAt'])]
+        row['has_wiki'] = [result['hasWikiEnabled']]
+        row['has_pages'] = [result['pages'] is not None]
+        rows.append(row)
+    if len(rows) == 0:
+        return None
+    return pd.DataFrame(rows)
+
+def crawl_repos(df, name, target_folder, verbose, workers=1, graphql_url=None, batch_size=50, file_format="csv"):
     """For each repository, retrieve metadata and store as CSV.
 
     Args:
@@ -47,25 +75,37 @@ def crawl_repos(df, name, target_folder, verbose):
         name (str): name of column containing the identifiers
         target_folder (str): path to folder to store CSV data in
         verbose (bool): toggles verbose output
+        workers (int, optional): number of repositories (or batches) to query concurrently. Defaults to 1.
+        graphql_url (str, optional): if given, query batches of repositories from this GraphQL endpoint instead of using the REST API. Defaults to None.
+        batch_size (int, optional): number of repositories per GraphQL query. Defaults to 50.
+        file_format (str, optional): format of the output files, "csv" or "parquet". Defaults to "csv".
     """
     repo_links = df[[name]]
     repo_links = repo_links.drop_duplicates()
-    g = Github(get_access_token())
+    if graphql_url is not None:
+        pool = GraphQLClient(get_access_tokens(), graphql_url)
+        func = query_metadata_batch
+    else:
+        pool = ClientPool(get_access_tokens())
+        func = query_metadata
+        batch_size = None
+        if verbose:
+            print(pool.rate_limiting)
     if verbose:
-        print(g.rate_limiting)
         print("Querying metadata...")
         start = time.time()
-    collect(g, repo_links, name, query_metadata, 
+    collect(pool, repo_links, name, func, 
             [],
-            os.path.join(target_folder, 'metadata.csv'))
+            os.path.join(target_folder, f'metadata.{file_format}'),
+            workers, batch_size)
     if verbose:
         end = time.time()
         print(f"Done - {end-start:.2f} seconds.")
 
-def main(path, name, datadir, verbose):
+def main(path, name, datadir, verbose, workers, graphql_url, batch_size, file_format):
     df = pd.read_csv(path)
     target_folder = datadir
-    crawl_repos(df, name, target_folder, verbose)
+    crawl_repos(df, name, target_folder, verbose, workers, graphql_url, batch_size, file_format)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -75,6 +115,11 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", required=True, type=str, help="CSV file")
     parser.add_argument("-n", "--name", required=True, type=str, help="name of column containing github ID")
     parser.add_argument("--datadir", default="../../data/raw/github/", help="directory to write GitHub data to")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of repositories to query concurrently")
+    parser.add_argument("--graphql", action="store_true", help="query batches of repositories through the GraphQL API")
+    parser.add_argument("--graphql-url", default=GRAPHQL_URL, type=str, help="GraphQL endpoint to use with --graphql")
+    parser.add_argument("--batch-size", default=50, type=int, help="number of repositories per GraphQL query")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the output files")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
     args = parser.parse_args()
-    main(args.file, args.name, args.datadir, args.verbose)
\ No newline at end of file
+    main(args.file, args.name, args.datadir, args.verbose, args.workers, args.graphql_url if args.graphql else None, args.batch_size, args.format)
\ No newline at end of file
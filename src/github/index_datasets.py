@@ -0,0 +1,26 @@
+import argparse
+import os
+from utils import index_dataset
+
+DATASETS = ["contents", "contributions", "forks", "issues", "metadata", "readme_history", "stars"]
+
+def main(datadir, name, file_format, verbose):
+    for dataset in DATASETS:
+        path = os.path.join(datadir, f"{dataset}.{file_format}")
+        if not os.path.exists(path):
+            continue
+        index_dataset(path, name)
+        if verbose:
+            print(f"Indexed {path}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="index_datasets",
+        description="Index the GitHub datasets by repository, so that the rows of a single repository can be read without reading the whole file. Datasets written by the crawling scripts are indexed already."
+    )
+    parser.add_argument("-n", "--name", default="github_user_cleaned_url", type=str, help="name of column containing github ID")
+    parser.add_argument("--datadir", default="../../data/raw/github/", help="directory containing the GitHub data")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="format of the data files")
+    parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
+    args = parser.parse_args()
+    main(args.datadir, args.name, args.format, args.verbose)
@@ -1,40 +1,176 @@
 import configparser
+import contextlib
+import csv
+import functools
+import itertools
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
 import traceback
+import weakref
+import pandas as pd
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from github import Github
 from github.GithubException import RateLimitExceededException, UnknownObjectException
 from datetime import datetime, timezone
 from time import sleep
 
+class TokenExhaustedException(Exception):
+    """Raised when the rate limit of an access token is exhausted while other tokens of its pool still have quota left."""
+
+class QueryFailedException(Exception):
+    """Raised when a GraphQL query still fails after retrying, so that the repositories it was about are not recorded as done and are queried again when the crawl is resumed."""
+
+FAILED = object()  # result of apply_query for rows whose query failed, see QueryFailedException
+
 def wrap_query(f):
     """Decorator to catch arbitrary exceptions when processing repository links.
 
     Args:
         f (function): function to decorate
     """
+    @functools.wraps(f)  # keeps decorated functions picklable, e.g. for process pools
     def wrapper(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except TokenExhaustedException:  # handled by apply_query, which retries with another token
+            raise
+        except QueryFailedException:  # handled by apply_query, which leaves the rows to a resumed run
+            raise
         except:
             msg = traceback.format_exc()
             print(f"[WARNING] Executing {f.__name__} with arguments {args} failed:\n{msg}\n")
     return wrapper
 
+class RateLimiter:
+    """Token bucket spreading the requests made with one access token evenly across Github's rate limit window.
+
+    The bucket refills at the rate the remaining quota allows until the window resets, as read from the rate limit headers PyGithub records with every response.
+    Requests are paid for after the fact by comparing the remaining quota with the last observation, so `wait` can be called more often than requests are made, e.g. once per item of a paginated list.
+
+    Args:
+        burst (int, optional): number of requests that can be made back-to-back before pacing sets in. Defaults to 10.
+    """
+    def __init__(self, burst=10):
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._remaining = None
+        self._reset = None
+
+    @property
+    def remaining(self):
+        """Remaining quota in the current rate limit window, infinite if unknown or if the window has reset since."""
+        if self._reset is None or self._reset <= time.time():
+            return float("inf")
+        return self._remaining
+
+    def _update(self, g):
+        """Refills the bucket and pays for the requests made since the last observation. Expects the lock to be held.
+
+        Returns:
+            float: current refill rate in requests per second
+        """
+        remaining, _ = g.rate_limiting
+        reset = g.rate_limiting_resettime
+        now = time.monotonic()
+        if self._reset is None or reset > self._reset:  # new rate limit window, the quota is full again
+            self._reset = reset
+            self._remaining = remaining
+            self._tokens = self.burst
+        rate = max(self._remaining, 1) / max(self._reset - time.time(), 1)
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+        if remaining < self._remaining:  # other clients sharing the token may report stale values
+            self._tokens -= self._remaining - remaining
+            self._remaining = remaining
+        return rate
+
+    def update(self, g):
+        """Records the quota reported to a client without pausing.
+
+        Args:
+            g (github.Github): authenticated access to Github API, the token of which this limiter paces
+        """
+        with self._lock:
+            self._update(g)
+
+    def wait(self, g):
+        """Pauses the calling thread until the requests made so far fit into the remaining quota.
+
+        Args:
+            g (github.Github): authenticated access to Github API, the token of which this limiter paces
+        """
+        with self._lock:
+            rate = self._update(g)
+            if self._tokens < 0:  # no need to wait beyond the reset of the window
+                sleep(min(-self._tokens / rate, max(self._reset - time.time(), 0)))
+                self._tokens = 0
+                self._updated = time.monotonic()
+
+_rate_limiters = {}  # access token -> RateLimiter
+_client_rate_limiters = weakref.WeakKeyDictionary()  # github.Github -> RateLimiter
+_client_pools = weakref.WeakKeyDictionary()  # github.Github -> ClientPool
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(token):
+    """Returns the rate limiter shared by all clients using the given access token.
+
+    Args:
+        token (str): Github API access token
+
+    Returns:
+        RateLimiter: shared rate limiter
+    """
+    with _rate_limiters_lock:
+        if token not in _rate_limiters:
+            _rate_limiters[token] = RateLimiter()
+        return _rate_limiters[token]
+
+def throttle(g):
+    """Paces requests made with a client so that its token's quota lasts until the rate limit resets. Call before each request or item of a paginated list.
+
+    Args:
+        g (github.Github): authenticated access to Github API
+    """
+    limiter = _client_rate_limiters.get(g)
+    if limiter is not None:
+        limiter.wait(g)
+
 def catch_rate_limit(g):
-    """Execute when running into Github's rate limit: Checks when the limit resets and pauses execution until then.
+    """Execute when running into Github's rate limit despite throttling, e.g. because of secondary rate limits or other processes using the same token: pauses execution until the limit resets.
+    If other tokens of the client's pool still have quota left, raises TokenExhaustedException instead so that the query is retried with one of them.
 
     Args:
         g (github.Github): authenticated access to Github API
     """
     print("Catching rate limit...")
-    print(g.rate_limiting)
-    print("Reset: ", g.get_rate_limit().core.reset)
-    reset = g.get_rate_limit().core.reset.replace(tzinfo=timezone.utc)
+    remaining, limit = g.rate_limiting  # taken from the headers of the last response
+    pool = _client_pools.get(g)
+    if pool is not None and remaining == 0:
+        _client_rate_limiters[g].update(g)
+        if pool.has_quota():
+            print("Switching to another access token.")
+            raise TokenExhaustedException()
+    reset = datetime.fromtimestamp(g.rate_limiting_resettime, tz=timezone.utc)
     now = datetime.now(tz=timezone.utc)
-    delta = reset - now
-    print("Now: ", now)
-    print("Wait for: ", delta.seconds+60)
-    sleep(delta.seconds+60)
-    print("Now: ", datetime.now(tz=timezone.utc))
-    print("Resume execution:",  g.get_rate_limit().core)
+    if remaining > 0:  # secondary rate limit, quota is not exhausted
+        wait = 60
+    else:
+        wait = max((reset - now).total_seconds(), 0) + 1
+    print(f"Remaining: {remaining}/{limit}, reset: {reset}, now: {now}")
+    print("Wait for: ", wait)
+    sleep(wait)
+    print("Resume execution: ", datetime.now(tz=timezone.utc))
 
 def safe_load_repo(g, link, func_name):
     """Attempts to load a repository, catching exceptions.
@@ -49,6 +185,7 @@ def safe_load_repo(g, link, func_name):
     """
     repo = None
     try:
+        throttle(g)
         repo = g.get_repo(link)
     except UnknownObjectException:
         print(f"{func_name}: Could not resolve repository for URL {link}.")
@@ -57,41 +194,744 @@ def safe_load_repo(g, link, func_name):
         repo = g.get_repo(link)  # retry
     return repo
 
-def get_access_token():
-    """Reads Github API access token from config file.
+def get_access_tokens():
+    """Reads Github API access tokens from config file. Several tokens can be listed as `tokens`, separated by commas or line breaks. Falls back to the single `token`.
 
     Returns:
-        str: access token
+        list<str>: access tokens
     """
     config = configparser.ConfigParser()
     config.read('../../config.cfg')
-    return config['ACCESS']['token']
+    if config.has_option('ACCESS', 'tokens'):
+        return [t for t in re.split(r"[,\s]+", config['ACCESS']['tokens']) if t]
+    return [config['ACCESS']['token']]
 
-def collect(g, df, name, func, drop_names, path):
-    """Interface for calling a query function on a dataframe of repositories.
+class ClientPool:
+    """Hands out authenticated Github clients, rotating across several access tokens. PyGithub clients reuse a single connection object and must not be shared between threads, so each thread gets its own client per token.
+    All clients are paced by the rate limiter of their token, see `throttle`.
 
     Args:
-        g (github.Github): authenticated access to Github API
-        df (pandas.DataFrame): DataFrame containing relevant columns
+        tokens (list<str>): Github API access tokens
+        **kwargs: passed on to github.Github
+    """
+    def __init__(self, tokens, **kwargs):
+        self.tokens = tokens
+        self.kwargs = kwargs
+        self._local = threading.local()
+
+    def has_quota(self):
+        """Checks whether any token has quota left in its current rate limit window.
+
+        Returns:
+            bool: True if at least one token can still be used
+        """
+        return any(get_rate_limiter(t).remaining > 0 for t in self.tokens)
+
+    def client(self, token=None):
+        """Returns the calling thread's client for the token with the most remaining quota, creating it on first use.
+
+        Args:
+            token (str, optional): use this token instead of choosing one. Defaults to None.
+
+        Returns:
+            github.Github: authenticated access to Github API
+        """
+        if token is None:
+            token = max(self.tokens, key=lambda t: get_rate_limiter(t).remaining)
+        if not hasattr(self._local, "clients"):
+            self._local.clients = {}
+        if token not in self._local.clients:
+            g = Github(token, **self.kwargs)
+            _client_rate_limiters[g] = get_rate_limiter(token)
+            _client_pools[g] = self
+            self._local.clients[token] = g
+        return self._local.clients[token]
+
+    @property
+    def rate_limiting(self):
+        """Remaining requests and request limit summed over all tokens.
+
+        Returns:
+            (int, int): remaining requests, request limit
+        """
+        limits = [self.client(t).rate_limiting for t in self.tokens]
+        return sum(r for r, _ in limits), sum(l for _, l in limits)
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+class GraphQLClient:
+    """Sends queries to Github's GraphQL API, rotating across access tokens. Unlike the REST API, one GraphQL query can fetch data about many repositories at once.
+
+    Args:
+        tokens (list<str>): Github API access tokens
+        url (str, optional): GraphQL endpoint, e.g. a local stand-in server replaying recorded responses. Defaults to GRAPHQL_URL.
+        retries (int, optional): number of times a query is retried after secondary rate limits, server errors or network errors. Defaults to 5.
+    """
+    def __init__(self, tokens, url=GRAPHQL_URL, retries=5):
+        self.tokens = tokens
+        self.url = url
+        self.retries = retries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._remaining = {t: float("inf") for t in tokens}
+        self._reset = {t: 0 for t in tokens}
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _choose_token(self):
+        """Picks the token with the most remaining quota, waiting for a reset if all are exhausted.
+
+        Returns:
+            str: access token
+        """
+        with self._lock:
+            now = time.time()
+            remaining = {t: (self._remaining[t] if self._reset[t] > now else float("inf")) for t in self.tokens}
+            token = max(self.tokens, key=lambda t: remaining[t])
+            if remaining[token] <= 0:
+                wait = self._reset[token] - now + 1
+                print(f"GraphQL rate limit exhausted for all tokens, wait for: {wait:.0f}")
+                sleep(wait)
+            return token
+
+    def query(self, query, variables=None):
+        """Sends a query, retrying once the rate limit resets if it was exceeded.
+        Secondary rate limits (403 or 429 with quota left), server errors (5xx), network errors and RATE_LIMITED errors in the response are retried up to `retries` times, after the time given in the Retry-After header or with exponential backoff.
+
+        Args:
+            query (str): GraphQL query
+            variables (dict, optional): values of the query's variables. Defaults to None.
+
+        Returns:
+            dict: response with keys "data" and, if parts of the query failed, "errors"
+
+        Raises:
+            QueryFailedException: if the query still fails after retrying, or fails with another error status
+        """
+        attempt = 0
+        while True:
+            token = self._choose_token()
+            try:
+                response = self._session().post(self.url, json={"query": query, "variables": variables or {}}, headers={"Authorization": f"bearer {token}"})
+            except requests.RequestException as e:
+                reason, wait = str(e), 2 ** attempt
+            else:
+                with self._lock:
+                    if "x-ratelimit-remaining" in response.headers:
+                        self._remaining[token] = int(response.headers["x-ratelimit-remaining"])
+                    if "x-ratelimit-reset" in response.headers:
+                        self._reset[token] = int(response.headers["x-ratelimit-reset"])
+                status = response.status_code
+                if status in (403, 429) and self._remaining[token] == 0:
+                    continue  # _choose_token waits for the reset
+                if status in (403, 429):  # secondary rate limit, Github asks to wait at least a minute without Retry-After
+                    reason, wait = f"status {status}", float(response.headers.get("retry-after", 60 * 2 ** attempt))
+                elif status >= 500:
+                    reason, wait = f"status {status}", float(response.headers.get("retry-after", 2 ** attempt))
+                elif status != 200:
+                    raise QueryFailedException(f"GraphQL query failed with status {status}: {response.text[:200]}")
+                else:
+                    result = response.json()
+                    if not any(error.get("type") == "RATE_LIMITED" for error in result.get("errors", [])):
+                        return result
+                    reason, wait = "RATE_LIMITED", 60 * 2 ** attempt
+            if attempt >= self.retries:
+                raise QueryFailedException(f"GraphQL query failed after {attempt + 1} attempts: {reason}")
+            attempt += 1
+            print(f"[WARNING] GraphQL query failed ({reason}), retrying in {wait:.0f} seconds.")
+            sleep(wait)
+
+def parse_graphql_datetime(timestamp):
+    """Parses a GraphQL timestamp into a naive UTC datetime, matching the dates returned by PyGithub.
+
+    Args:
+        timestamp (str): ISO 8601 timestamp, e.g. "2023-02-10T01:03:13Z"
+
+    Returns:
+        datetime.datetime: parsed timestamp, None if timestamp is None
+    """
+    if timestamp is None:
+        return None
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+
+def query_repos_graphql(client, repo_links, fields):
+    """Queries fields for several repositories in one GraphQL request.
+
+    Args:
+        client (GraphQLClient): access to Github's GraphQL API
+        repo_links (list<str>): repository IDs ("user/repo")
+        fields (str | list<str>): GraphQL selection on the Repository type, either the same for all repositories or one per repository
+
+    Returns:
+        list<dict>: data for each repository in the order of repo_links, None where the repository could not be resolved
+    """
+    if type(fields) == str:
+        fields = [fields] * len(repo_links)
+    params, selections, variables = [], [], {}
+    for i, link in enumerate(repo_links):
+        owner, _, repo_name = str(link).partition("/")
+        params.append(f"$owner{i}: String!, $name{i}: String!")
+        selections.append(f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{ {fields[i]} }}")
+        variables[f"owner{i}"] = owner
+        variables[f"name{i}"] = repo_name
+    query = f"query({', '.join(params)}) {{ {' '.join(selections)} }}"
+    response = client.query(query, variables)
+    data = response.get("data") or {}
+    for error in response.get("errors", []):
+        if error.get("type") != "NOT_FOUND":
+            print(f"[WARNING] GraphQL error: {error.get('message')}")
+    results = [data.get(f"r{i}") for i in range(len(repo_links))]
+    for link, result in zip(repo_links, results):
+        if result is None:
+            print(f"query_repos_graphql: Could not resolve repository for URL {link}.")
+    return results
+
+GITHUB_URL = "https://github.com/"
+
+_mirrored = set()  # local clones already cloned or fetched by this process
+_mirror_locks = {}  # local clone path -> threading.Lock
+_mirror_locks_lock = threading.Lock()
+
+def run_git(repo_path, *args, check=True, input=None):
+    """Runs a git command on a local bare clone.
+
+    Args:
+        repo_path (str): path to the local clone
+        args (str): git subcommand and its arguments
+        check (bool, optional): raise subprocess.CalledProcessError if the command fails. Defaults to True.
+        input (bytes, optional): data passed to the command's standard input. Defaults to None.
+
+    Returns:
+        bytes: standard output of the command
+    """
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")  # fail instead of asking for credentials
+    return subprocess.run(["git", "--git-dir", repo_path, *args], check=check, capture_output=True, input=input, env=env).stdout
+
+def mirror_repo(repo_link, cache_dir, base_url=GITHUB_URL):
+    """Keeps a local bare clone of a repository, so that all history queries on it share a single clone.
+    The first call clones the repository into cache_dir. Clones left there by earlier runs are updated with git fetch instead, once per process.
+    Clones are partial: they contain all commits and trees, but no file contents, which git fetches on demand (see fetch_blobs).
+
+    Args:
+        repo_link (str): repository ID ("user/repo")
+        cache_dir (str): directory containing the local clones
+        base_url (str, optional): URL the repository ID is appended to for cloning. Defaults to GITHUB_URL.
+
+    Returns:
+        str: path to the local clone
+    """
+    path = os.path.join(cache_dir, repo_link + ".git")
+    with _mirror_locks_lock:
+        lock = _mirror_locks.setdefault(path, threading.Lock())
+    with lock:
+        if path in _mirrored:
+            return path
+        if os.path.isdir(path):
+            run_git(path, "fetch", "--quiet", "--prune", "origin", "+refs/heads/*:refs/heads/*")
+        else:
+            tmp_path = path + ".tmp"
+            if os.path.isdir(tmp_path):  # left over from an interrupted clone
+                shutil.rmtree(tmp_path)
+            clone_repo(repo_link, tmp_path, base_url)
+            os.replace(tmp_path, path)
+        _mirrored.add(path)
+    return path
+
+def clone_repo(repo_link, path, base_url=GITHUB_URL):
+    """Makes a partial bare clone of a repository, with all commits and trees but no file contents (see fetch_blobs).
+
+    Args:
+        repo_link (str): repository ID ("user/repo")
+        path (str): path to clone into
+        base_url (str, optional): URL the repository ID is appended to for cloning. Defaults to GITHUB_URL.
+    """
+    subprocess.run(["git", "clone", "--quiet", "--bare", "--filter=blob:none", base_url + repo_link, path],
+                   check=True, capture_output=True, env=dict(os.environ, GIT_TERMINAL_PROMPT="0"))
+
+@contextlib.contextmanager
+def local_clone(repo_link, cache_dir=None, base_url=GITHUB_URL):
+    """Provides a local bare clone of a repository for the duration of a with block.
+    With cache_dir, the clone is kept there for later queries and runs (see mirror_repo). Without, the repository is cloned into a temporary directory that is removed at the end of the block, so that disk use does not grow with the number of repositories crawled.
+
+    Args:
+        repo_link (str): repository ID ("user/repo")
+        cache_dir (str, optional): directory containing the local clones. Defaults to None.
+        base_url (str, optional): URL the repository ID is appended to for cloning. Defaults to GITHUB_URL.
+
+    Yields:
+        str: path to the local clone
+    """
+    if cache_dir is not None:
+        yield mirror_repo(repo_link, cache_dir, base_url)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "repo.git")
+        clone_repo(repo_link, path, base_url)
+        yield path
+
+def fetch_blobs(repo_path, filepaths):
+    """Fetches the contents of some files across their whole history into a partial clone, in a single request.
+    Otherwise, git fetches them one by one when they are first needed.
+
+    Args:
+        repo_path (str): path to a local clone made by mirror_repo
+        filepaths (list<str>): paths of the files within the repository, whose renames are followed
+    """
+    if run_git(repo_path, "config", "--get", "remote.origin.promisor", check=False).strip() != b"true":
+        return  # full clone, nothing to fetch
+    oids = set()
+    for filepath in filepaths:
+        raw = run_git(repo_path, "log", "--follow", "--format=", "--raw", "--no-abbrev", "--", filepath, check=False)
+        for line in raw.decode().splitlines():
+            if line.startswith(":"):
+                oids.update(line.split()[2:4])  # blobs before and after the change
+    oids.discard("0" * 40)
+    if len(oids) == 0:
+        return
+    run_git(repo_path, "-c", "fetch.negotiationAlgorithm=noop", "fetch", "--quiet", "--no-tags", "--no-write-fetch-head",
+            "--filter=blob:none", "--stdin", "origin", check=False, input="\n".join(sorted(oids)).encode())
+
+def query_repo(func, row, name, pool):
+    """Calls a query function on a repository, retrying with another access token if one runs out of quota.
+
+    Args:
+        func (function): pointer to query function
+        row (pd.Series): row passed on to the query function
+        name (str): name of the column containing repository ID
+        pool (ClientPool): source of authenticated Github clients
+
+    Returns:
+        pd.Series: result of the query function
+    """
+    while True:
+        try:
+            return func(row.copy(), name, pool.client())
+        except TokenExhaustedException:
+            pass
+
+def query_repo_offline(func, row, name):
+    """Calls a query function that does not need access to the Github API on a repository. Runs in worker processes, see apply_query.
+
+    Args:
+        func (function): pointer to query function
+        row (pd.Series): row passed on to the query function
         name (str): name of the column containing repository ID
+
+    Returns:
+        dict: maps the row's label to the result of the query function
+    """
+    return {row.name: func(row.copy(), name, None)}
+
+def limit_memory(limit):
+    """Caps the address space of the current process, so that queries running out of memory fail with a MemoryError instead of taking down the machine. Used to initialise worker processes.
+
+    Args:
+        limit (int): maximum address space in bytes, None for no limit
+    """
+    if limit is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def arrow_table(df):
+    """Converts a dataframe to an Arrow table for writing to Parquet. Columns holding datetimes are stored as UTC timestamps, lists as native list columns.
+
+    Args:
+        df (pd.DataFrame): data as returned by query functions, where naive datetimes are in UTC
+
+    Returns:
+        pyarrow.Table: table including the dataframe's index
+    """
+    import pyarrow as pa
+    df = df.copy()
+    for c in df.columns:
+        values = df[c].dropna()
+        if pd.api.types.is_datetime64_dtype(df[c]):
+            df[c] = df[c].dt.tz_localize("UTC")
+        elif df[c].dtype == object and len(values) > 0 and values.map(lambda v: isinstance(v, datetime)).all():
+            df[c] = pd.to_datetime(df[c], utc=True)
+    return pa.Table.from_pandas(df, preserve_index=True)
+
+def read_dataset(path):
+    """Reads a dataset written by collect.
+
+    Args:
+        path (str): path to a CSV or Parquet (".parquet") file
+
+    Returns:
+        pd.DataFrame: dataset, indexed by the labels of the input rows
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, index_col=0)
+
+def write_dataset(df, path):
+    """Writes a dataset in the format given by the file extension, see read_dataset.
+
+    Args:
+        df (pd.DataFrame): dataset
+        path (str): path to a CSV or Parquet (".parquet") file
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        pq.write_table(arrow_table(df), path, row_group_size=10000)  # small row groups keep reads of single repositories cheap, see index_dataset
+    else:
+        df.to_csv(path)
+
+def index_dataset(path, name):
+    """Writes an index next to a dataset, listing where the rows of each repository are in the file, so that they can be read without reading the whole file.
+    The index is a CSV file named after the dataset with the suffix ".index" and columns name, "start", "end": byte offsets in CSV files, row numbers in Parquet files.
+    Repositories have one entry for each run of consecutive rows, usually a single one.
+    The size and modification time of the dataset are recorded in a JSON file with the suffix ".index.json", so that readers can tell if the dataset has been rewritten since.
+
+    Args:
+        path (str): path to a CSV or Parquet (".parquet") file
+        name (str): name of the column containing repository ID
+    """
+    stat = os.stat(path)
+    entries = []
+    def add(repo, start, end):
+        if len(entries) > 0 and entries[-1][0] == repo and entries[-1][2] == start:
+            entries[-1][2] = end
+        else:
+            entries.append([repo, start, end])
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for i, repo in enumerate(pq.read_table(path, columns=[name]).column(name).to_pylist()):
+            add(repo, i, i + 1)
+    else:
+        with open(path, "rb") as f:
+            offset = 0
+            def lines():  # keeps track of the bytes consumed by the CSV reader
+                nonlocal offset
+                for line in f:
+                    offset += len(line)
+                    yield line.decode("utf-8")
+            reader = csv.reader(lines())
+            column = next(reader).index(name)
+            start = offset
+            for record in reader:
+                add(record[column], start, offset)
+                start = offset
+    pd.DataFrame(entries, columns=[name, "start", "end"]).to_csv(path + ".index", index=False)
+    with open(path + ".index.json", "w") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+
+def combine_parts(parts_dir, path, columns, keep=False):
+    """Concatenates the Parquet files written by collect one chunk at a time into one file, one row group per chunk.
+
+    Args:
+        parts_dir (str): directory with the chunks, named by their number
+        path (str): path of the Parquet file to write
+        columns (list<str>): columns of the dataset, used if there are no chunks
+        keep (bool, optional): keep the chunks, e.g. so that an incomplete crawl can be resumed. Defaults to False.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    parts = sorted(os.listdir(parts_dir)) if os.path.isdir(parts_dir) else []
+    if len(parts) == 0:
+        write_dataset(pd.DataFrame(columns=columns), path)
+    else:
+        parts = [os.path.join(parts_dir, part) for part in parts]
+        schema = pa.unify_schemas([pq.read_schema(part) for part in parts])  # columns that were empty in some chunks take the type of the others
+        with pq.ParquetWriter(path + ".tmp", schema) as writer:
+            for part in parts:
+                writer.write_table(pq.read_table(part).cast(schema))
+        os.replace(path + ".tmp", path)
+    if os.path.isdir(parts_dir) and not keep:
+        shutil.rmtree(parts_dir)
+
+class Journal:
+    """Append-only JSON lines file next to an output file, recording which repositories have been written to the output file so far and where it ends (its size for CSV files, the number of chunks written for Parquet files). Allows crawls to be resumed after a crash.
+
+    Args:
+        path (str): path of the output file the journal belongs to
+    """
+    def __init__(self, path):
+        self.path = os.path.splitext(path)[0] + ".journal.jsonl"
+        self._file = None
+
+    def load(self):
+        """Reads the progress recorded by a previous, interrupted run.
+
+        Returns:
+            tuple: index labels of the input rows already written (list), and end of the output file after they were written (int, 0 if there is no journal)
+        """
+        labels, offset = [], 0
+        if not os.path.exists(self.path):
+            return labels, offset
+        with open(self.path, "rb+") as f:  # drop the last line if it was only partly written before a crash
+            content = f.read()
+            f.truncate(content.rfind(b"\n") + 1)
+        with open(self.path) as f:
+            for line in f:
+                entry = json.loads(line)
+                labels.extend(entry["index"])
+                offset = entry["offset"]
+        return labels, offset
+
+    def append(self, labels, offset):
+        """Durably records that the results for some input rows have been written to the output file.
+
+        Args:
+            labels (list): index labels of the input rows
+            offset (int): end of the output file after writing them
+        """
+        labels = [label.item() if hasattr(label, "item") else label for label in labels]  # numpy scalars are not JSON serialisable
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps({"index": labels, "offset": offset}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def remove(self):
+        """Deletes the journal once the output file is complete."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def apply_query(df, func, name, pool, workers=1, batch_size=None, executor=None):
+    """Calls a query function on each row of a dataframe, optionally spread across a pool of threads.
+    Results are yielded in input order as soon as the queries for all earlier rows are done. Only a few queries per worker are run ahead, so that at most that many results are held in memory.
+
+    Args:
+        df (pandas.DataFrame): DataFrame containing relevant columns
         func (function): pointer to query function
+        name (str): name of the column containing repository ID
+        pool (ClientPool | GraphQLClient): source of authenticated Github clients, or GraphQL client for batched query functions
+        workers (int, optional): number of threads to run queries in, or of workers in the executor. Defaults to 1, i.e. sequential execution.
+        batch_size (int, optional): if given, the query function is called on slices of this many rows instead of single rows and returns a dataframe. Defaults to None.
+        executor (concurrent.futures.Executor, optional): if given, rows are queried in this executor instead of a pool of threads, e.g. in a process pool for CPU-bound query functions. The query function is then passed no Github client. Cannot be combined with batch_size. Defaults to None.
+
+    Yields:
+        tuple: index label of an input row and the result of the query function for it (pd.Series, None if there is none, FAILED if the query failed and should be retried in a later run)
+    """
+    if batch_size is not None:
+        units = (df.iloc[i:i+batch_size] for i in range(0, len(df), batch_size))
+        def run(batch):
+            try:
+                d = func(batch, name, pool)
+            except QueryFailedException as e:
+                print(f"[WARNING] Querying a batch of {len(batch)} repositories failed, they are left for a resumed run: {e}")
+                return {label: FAILED for label in batch.index}
+            return {label: (d.loc[label] if d is not None and label in d.index else None) for label in batch.index}
+    else:
+        units = (row for _, row in df.iterrows())
+        def run(row):
+            return {row.name: query_repo(func, row, name, pool)}
+    threads = ThreadPoolExecutor(max_workers=max(workers, 1)) if executor is None else None
+    if threads is not None:
+        submit = lambda unit: threads.submit(run, unit)
+    else:
+        submit = lambda row: executor.submit(query_repo_offline, func, row, name)
+    window = 4 * max(workers, 1)
+    try:
+        pending = deque(submit(unit) for unit in itertools.islice(units, window))
+        while len(pending) > 0:
+            results = pending.popleft().result()
+            for unit in itertools.islice(units, 1):
+                pending.append(submit(unit))
+            yield from results.items()
+    finally:
+        if threads is not None:
+            threads.shutdown(cancel_futures=True)
+
+def flatten_result(result, cols_to_ignore, drop_names):
+    """Turns the result of a query function into rows of the output file, one per element of its list-valued columns.
+
+    Args:
+        result (pd.Series): result of the query function for one repository
+        cols_to_ignore (list<str>): columns of the input dataframe, which hold single values
         drop_names (list): list of columns that should be matched against NaN (if all of them are NaN, the row is dropped) - can be empty
-        path (str): path to write CSV file to
+
+    Returns:
+        pd.DataFrame: rows for the repository, indexed by the label of its input row
+
+    Raises:
+        ValueError: if the list-valued columns have differing lengths
     """
-    d = df.apply(func, axis=1, args=(name, g))
-    cols = list(d.columns)
-    cols_to_ignore = list(df.columns)
-    cols_to_explode = [c for c in cols if not c in cols_to_ignore]
+    d = pd.DataFrame([result])
+    cols_to_explode = [c for c in d.columns if not c in cols_to_ignore]
     d = d.dropna()
-    store_pickled_backup = False
-    try:
-        d = d.explode(cols_to_explode)
-    except ValueError:
-        msg = traceback.format_exc()
-        print(f"[WARNING] Could not explode DataFrame:\n{msg}\n")
-        store_pickled_backup = True
+    d = d.explode(cols_to_explode)
     if len(drop_names) > 0:
         d.dropna(axis=0, how='all', subset=drop_names, inplace=True)
-    d.to_csv(path)
-    if store_pickled_backup:  # if explode did not work, pickle will preserve lists
-        d.to_pickle(path[:-3] + "pickle")
\ No newline at end of file
+    return d
+
+def collect(pool, df, name, func, drop_names, path, workers=1, batch_size=None, executor=None, chunk_size=10000, journal_interval=60):
+    """Interface for calling a query function on a dataframe of repositories.
+    The results for each repository are written to the output file as soon as those for all earlier repositories are, so that memory use does not grow with the size of the dataset.
+    Once complete, the output file is indexed by repository (see index_dataset).
+
+    Args:
+        pool (ClientPool | GraphQLClient): source of authenticated Github clients, or GraphQL client for batched query functions
+        df (pandas.DataFrame): DataFrame containing relevant columns
+        name (str): name of the column containing repository ID
+        func (function): pointer to query function
+        drop_names (list): list of columns that should be matched against NaN (if all of them are NaN, the row is dropped) - can be empty
+        path (str): path to write CSV file to, or Parquet file if it ends with ".parquet"
+        workers (int, optional): number of repositories (or batches) to query concurrently. Defaults to 1.
+        batch_size (int, optional): number of repositories passed to a batched query function at once. Defaults to None, i.e. the query function takes single rows.
+        executor (concurrent.futures.Executor, optional): runs query functions not needing a Github client, e.g. a process pool. Defaults to None, i.e. threads.
+        chunk_size (int, optional): number of rows to buffer before appending them to the output file. Defaults to 10000.
+        journal_interval (float, optional): seconds after which buffered rows are appended and journaled even if there are fewer than chunk_size, bounding the work lost in a crash. Defaults to 60.
+    """
+    parquet = path.endswith(".parquet")
+    parts_dir = path + ".parts"  # Parquet files are written one file per chunk, then combined
+    pickle_path = os.path.splitext(path)[0] + ".pickle"  # results that could not be exploded
+    journal = Journal(path)  # resumes an interrupted run if a journal exists
+    done, offset = journal.load()
+    todo = df[~df.index.isin(done)]
+    columns = None
+    if len(done) > 0:
+        print(f"Resuming from {journal.path}: {len(done)} done, {len(todo)} to go.")
+        if parquet and offset > 0 and not os.path.isdir(parts_dir) and os.path.exists(path):
+            # interrupted after the chunks were combined, nothing left to do
+            index_dataset(path, name)
+            journal.remove()
+            return
+        # drop rows written after the last journal entry
+        if parquet:
+            parts = os.listdir(parts_dir) if os.path.isdir(parts_dir) else []  # no chunks if all results so far were empty
+            for part in parts:
+                if int(os.path.splitext(part)[0]) >= offset:
+                    os.remove(os.path.join(parts_dir, part))
+            if offset > 0:
+                columns = list(pd.read_parquet(os.path.join(parts_dir, f"{0:05d}.parquet")).columns)
+        elif os.path.exists(path):  # not written yet if all results so far were empty
+            with open(path, "rb+") as f:
+                f.truncate(offset)
+            if offset > 0:
+                columns = list(pd.read_csv(path, index_col=0, nrows=0).columns)
+    else:
+        if parquet and os.path.isdir(parts_dir):
+            shutil.rmtree(parts_dir)
+        if os.path.exists(pickle_path):
+            os.remove(pickle_path)
+    cols_to_ignore = list(df.columns)
+    chunk, labels, n_rows, unexploded, failed = [], [], 0, [], 0
+    flushed = time.monotonic()
+    def flush():
+        nonlocal offset, chunk, labels, n_rows, unexploded, flushed
+        if len(chunk) > 0 and parquet:
+            os.makedirs(parts_dir, exist_ok=True)
+            write_dataset(pd.concat(chunk), os.path.join(parts_dir, f"{offset:05d}.parquet"))
+            offset += 1
+        elif len(chunk) > 0:
+            with open(path, "a" if offset > 0 else "w", newline="") as f:
+                pd.concat(chunk).to_csv(f, header=offset == 0)
+                offset = f.tell()
+        if len(unexploded) > 0:  # pickle will preserve lists
+            d = pd.DataFrame(unexploded)
+            if os.path.exists(pickle_path):  # earlier chunks, possibly of an interrupted run
+                d = pd.concat([pd.read_pickle(pickle_path), d])
+            d.to_pickle(pickle_path + ".tmp")
+            os.replace(pickle_path + ".tmp", pickle_path)
+        journal.append(labels, offset)
+        chunk, labels, n_rows, unexploded = [], [], 0, []
+        flushed = time.monotonic()
+    for label, result in apply_query(todo, func, name, pool, workers, batch_size, executor):
+        if result is FAILED:  # not journaled, so that a resumed run queries it again
+            failed += 1
+            continue
+        labels.append(label)
+        if result is not None:
+            if columns is None:
+                columns = list(result.index)
+            result = result.reindex(columns)
+            try:
+                d = flatten_result(result, cols_to_ignore, drop_names)
+                chunk.append(d)
+                n_rows += len(d)
+            except ValueError:
+                msg = traceback.format_exc()
+                print(f"[WARNING] Could not explode results for {result[name]}:\n{msg}\n")
+                unexploded.append(result)
+        if n_rows >= chunk_size or time.monotonic() - flushed >= journal_interval:
+            flush()
+    flush()
+    if parquet:
+        combine_parts(parts_dir, path, columns or df.columns, keep=failed > 0)
+    elif offset == 0:  # no results at all
+        pd.DataFrame(columns=columns or df.columns).to_csv(path)
+    index_dataset(path, name)
+    if failed > 0:  # keep the journal, so that running the crawl again only queries these
+        print(f"[WARNING] Queries for {failed} repositories failed. Run the same command again to query them.")
+    else:
+        journal.remove()
+
+def latest_dates(path, name, date_columns):
+    """Finds the latest date recorded for each repository in an existing dataset.
+
+    Args:
+        path (str): path to CSV or Parquet file written by collect
+        name (str): name of the column containing repository ID
+        date_columns (list<str>): columns with dates to consider
+
+    Returns:
+        dict: maps repository IDs to their latest date (naive datetime.datetime in UTC, like the dates returned by PyGithub); repositories without dates are left out
+    """
+    df = read_dataset(path)
+    dates = df[date_columns].apply(lambda c: pd.to_datetime(c, utc=True).dt.tz_localize(None)).max(axis=1)
+    latest = dates.groupby(df[name]).max().dropna()
+    return {repo: date.to_pydatetime() for repo, date in latest.items()}
+
+def merge_crawl(path, update_path, name, key_columns):
+    """Merges the output of an incremental crawl into an existing dataset. Rows of the update replace existing rows with the same key, new rows are added after the existing ones of their repository.
+
+    Args:
+        path (str): path to the existing CSV or Parquet file, which is overwritten
+        update_path (str): path to the file written by the incremental crawl, in the same format
+        name (str): name of the column containing repository ID
+        key_columns (list<str>): columns identifying an event within a repository
+    """
+    existing = read_dataset(path)
+    update = read_dataset(update_path)
+    merged = pd.concat([existing, update])
+    repo_order = merged[name].drop_duplicates()
+    repo_order = pd.Series(range(len(repo_order)), index=repo_order)
+    merged = merged.drop_duplicates(subset=[name] + key_columns, keep="last")
+    # drop placeholder rows of repositories that had no events before
+    value_columns = [c for c in merged.columns if c != name]
+    empty = merged[value_columns].isna().all(axis=1)
+    merged = merged[~(empty & merged[name].isin(merged.loc[~empty, name]))]
+    # group rows by repository, keeping the order in which repositories first appear
+    merged = merged.iloc[repo_order[merged[name]].argsort(kind="stable")]
+    tmp_path = path + ".tmp" + os.path.splitext(path)[1]  # keeps the extension selecting the format
+    write_dataset(merged, tmp_path)
+    os.replace(tmp_path, path)
+    index_dataset(path, name)
+
+def collect_incremental(pool, df, name, func, drop_names, path, date_columns, key_columns, workers=1):
+    """Like collect, but if the output file exists, only queries events since the latest date recorded for each repository and merges them into the file.
+
+    Args:
+        pool (ClientPool): source of authenticated Github clients
+        df (pandas.DataFrame): DataFrame containing relevant columns
+        name (str): name of the column containing repository ID
+        func (function): pointer to query function accepting a `since` dictionary mapping repository IDs to dates
+        drop_names (list): list of columns that should be matched against NaN (if all of them are NaN, the row is dropped) - can be empty
+        path (str): path to CSV or Parquet file to update
+        date_columns (list<str>): columns with event dates, used to find the latest crawled event
+        key_columns (list<str>): columns identifying an event within a repository, used to replace updated events
+        workers (int, optional): number of repositories to query concurrently. Defaults to 1.
+    """
+    if not os.path.exists(path):
+        collect(pool, df, name, func, drop_names, path, workers)
+        return
+    since = latest_dates(path, name, date_columns)
+    update_path = "_update".join(os.path.splitext(path))
+    collect(pool, df, name, functools.partial(func, since=since), drop_names, update_path, workers)
+    merge_crawl(path, update_path, name, key_columns)
+    os.remove(update_path)
+    os.remove(update_path + ".index")
+    os.remove(update_path + ".index.json")
+    # repositories whose queries failed are caught up by the next incremental crawl
+    Journal(update_path).remove()
+    if os.path.isdir(update_path + ".parts"):
+        shutil.rmtree(update_path + ".parts")